@@ -0,0 +1,90 @@
+"""
+Runs the benchmark suite and writes the results as json, pass a previous results file with --compare to see
+how the medians moved between commits. Everything runs offline against fakes.
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --compare results.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks import channels, clients, datachannel, forward, inventory, proxycommand, search, selectors, startup
+from benchmarks.common import REPO_ROOT
+
+SUITES = {
+    "startup": lambda quick: startup.run(runs=3 if quick else 10),
+    "clients": lambda quick: clients.run(channels=20 if quick else 100),
+    "channels": lambda quick: channels.run(concurrency=(1, 10, 100) if quick else (1, 10, 100, 300)),
+    "search": lambda quick: search.run(instances=10000),
+    "selectors": lambda quick: selectors.run(instances=20, repeat=3 if quick else 5),
+    "inventory": lambda quick: inventory.run(instances=(1000,) if quick else (1000, 10000), repeat=3 if quick else 5),
+    "proxycommand": lambda quick: proxycommand.run(repeat=2 if quick else 5, megabytes=8 if quick else 32),
+    "datachannel": lambda quick: datachannel.run(repeat=3 if quick else 10, megabytes=1 if quick else 4),
+    "forward": lambda quick: forward.run(megabytes=8 if quick else 64),
+}
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+    }
+
+
+def medians(results: dict, prefix: str = "") -> dict:
+    """ Flattens results to {"suite.path": median} for every summary in them """
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict) and "median" in value:
+            flat[f"{prefix}{key}"] = value["median"]
+        elif isinstance(value, dict):
+            flat.update(medians(value, f"{prefix}{key}."))
+    return flat
+
+
+def compare(baseline: dict, current: dict):
+    before = medians(baseline["results"])
+    after = medians(current["results"])
+    for key in sorted(after):
+        if key in before and before[key]:
+            change = (after[key] - before[key]) / before[key] * 100
+            print(f"{key:<60} {before[key]:>12.2f} {after[key]:>12.2f} {change:>+8.1f}%")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", action="append", choices=list(SUITES), help="suite to run, can be repeated, defaults to all")
+    parser.add_argument("--quick", action="store_true", help="fewer repeats, for a smoke run")
+    parser.add_argument("--output", "-o", help="write results json here instead of stdout")
+    parser.add_argument("--compare", help="previous results json to compare against")
+    args = parser.parse_args(argv)
+
+    results = {"meta": metadata(), "results": {}}
+    for name in args.suite or SUITES:
+        print(f"running {name}", file=sys.stderr)
+        results["results"][name] = SUITES[name](args.quick)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Many direct-tcpip channels opened at once through SshServer, like hundreds of `ssh -W`/`-L`
+connections starting together. Reports how long each takes to open, and to open and echo its first byte, and how
+many failed.
+
+    python -m benchmarks.channels --concurrency 1,10,100,300
+"""
+import argparse
+import json
+import logging
+import shlex
+import sys
+import threading
+import time
+
+from benchmarks.common import isolated_env, generate_hostkey, summarize
+from benchmarks.fakes import start_echo_server
+
+
+def start_server(engine: str):
+    """ SshServer in its own process over a ProxyCommand, so the client threads do not share its GIL """
+    import paramiko
+
+    sock = paramiko.ProxyCommand(f"{shlex.quote(sys.executable)} -m benchmarks.fakes direct {engine}")
+    transport = paramiko.Transport(sock)
+    transport.start_client(timeout=30)
+    transport.auth_none("bench")
+    return transport
+
+
+def open_many(transport, echo: tuple, count: int) -> dict:
+    opens = []
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    start_together = threading.Barrier(count)
+
+    def open_one():
+        start_together.wait()
+        start = time.perf_counter()
+        try:
+            chan = transport.open_channel("direct-tcpip", echo, ("127.0.0.1", 0), timeout=30)
+            opened = (time.perf_counter() - start) * 1000
+            chan.settimeout(30)
+            chan.sendall(b"x")
+            if chan.recv(1) != b"x":
+                raise RuntimeError("echo did not come back")
+            elapsed = (time.perf_counter() - start) * 1000
+            chan.close()
+        except Exception as e:
+            with lock:
+                failures.append(str(e))
+            return
+        with lock:
+            opens.append(opened)
+            latencies.append(elapsed)
+
+    threads = [threading.Thread(target=open_one) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "open_ms": summarize(opens) if opens else None,
+        "open_to_first_byte_ms": summarize(latencies) if latencies else None,
+        "failures": len(failures),
+    }
+
+
+def run(concurrency=(1, 10, 100, 300), engine: str = "asyncio") -> dict:
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    with isolated_env():
+        generate_hostkey()
+        echo = start_echo_server()
+        results = {}
+        for count in concurrency:
+            transport = start_server(engine)
+            try:
+                results[str(count)] = open_many(transport, echo, count)
+            finally:
+                transport.close()
+        return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", default="1,10,100,300", help="comma separated numbers of channels opened at once")
+    parser.add_argument("--engine", choices=["asyncio", "thread"], default="asyncio")
+    args = parser.parse_args(argv)
+    concurrency = [int(count) for count in args.concurrency.split(",")]
+    print(json.dumps(run(concurrency, args.engine), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Per channel ssm:StartSession latency, building a new boto3 client for each call against reusing the cached
+client from ssm_cli.clients. Responses come from botocore Stubber, so this measures the client side cost
+(service model loading, client setup) and not the TLS handshakes a pooled connection also saves.
+
+    python -m benchmarks.clients --channels 50
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.common import isolated_env, summarize
+
+CONFIG = "group_tag_key: group\n"
+START_SESSION = {
+    "SessionId": "bench-0",
+    "TokenValue": "token",
+    "StreamUrl": "wss://ssmmessages.eu-west-1.amazonaws.com/v1/data-channel/bench-0",
+}
+START_SESSION_PARAMS = {
+    "Target": "i-0bench",
+    "DocumentName": "AWS-StartPortForwardingSessionToRemoteHost",
+    "Parameters": {"host": ["localhost"], "portNumber": ["22"], "localPortNumber": ["40000"]},
+}
+
+
+def stub(client, calls: int):
+    from botocore.stub import Stubber
+
+    stubber = Stubber(client)
+    for _ in range(calls):
+        stubber.add_response("start_session", START_SESSION, START_SESSION_PARAMS)
+    stubber.activate()
+    return client
+
+
+def per_channel(get, channels: int) -> dict:
+    samples = []
+    for _ in range(channels):
+        start = time.perf_counter()
+        get().start_session(**START_SESSION_PARAMS)
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def run(channels: int = 50) -> dict:
+    with isolated_env(CONFIG):
+        import boto3
+        from confclasses import load_config
+        from ssm_cli.clients import get_client
+        from ssm_cli.config import config
+
+        load_config(config, CONFIG)
+
+        session = boto3.Session(region_name="eu-west-1")
+        # warm the loader caches both ways, the first client of a process pays for reading the models from disk
+        session.client("ssm")
+
+        uncached = per_channel(lambda: stub(session.client("ssm"), 1), channels)
+
+        cached_session = boto3.Session(region_name="eu-west-1")
+        stub(get_client(cached_session, "ssm"), channels)
+        cached = per_channel(lambda: get_client(cached_session, "ssm"), channels)
+
+        return {
+            "channels": channels,
+            "new_client_ms": uncached,
+            "cached_client_ms": cached,
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--channels", type=int, default=50)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.channels), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
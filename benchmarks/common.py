@@ -0,0 +1,110 @@
+"""
+Shared helpers for the benchmarks, everything here runs offline against fakes and temp dirs.
+"""
+import contextlib
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """ Summary of timings (or any other samples), sorted so percentiles are a lookup """
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        "mean": statistics.fmean(ordered),
+        "max": ordered[-1],
+    }
+
+
+def time_calls(call: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """ Runs call `repeat` times, returning a summary in milliseconds """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def process_tree_cpu(pid: int) -> Optional[float]:
+    """ User+system CPU seconds of a process and everything running under it so far, None without /proc """
+    stats = {}
+    try:
+        for entry in Path("/proc").iterdir():
+            if not entry.name.isdigit():
+                continue
+            try:
+                # the command name can have spaces in it, fields are counted from after its closing bracket
+                fields = (entry / "stat").read_text().rpartition(")")[2].split()
+            except OSError:
+                continue
+            stats[int(entry.name)] = (int(fields[1]), int(fields[11]) + int(fields[12]))
+    except OSError:
+        return None
+    if pid not in stats:
+        return None
+
+    ticks = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        ticks += stats[current][1]
+        pending.extend(child for child, (parent, _) in stats.items() if parent == current)
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+@contextlib.contextmanager
+def isolated_env(config: str = "group_tag_key: group\n") -> Iterator[Dict[str, str]]:
+    """
+    Temp XDG and AWS config so nothing touches the real user setup or the network. Yields the environment
+    for subprocesses, it is also applied to this process for the duration.
+    """
+    with tempfile.TemporaryDirectory(prefix="ssm-bench-") as tmp:
+        tmp = Path(tmp)
+        conf_root = tmp / "config" / "ssm-cli"
+        conf_root.mkdir(parents=True)
+        (conf_root / "ssm.yaml").write_text(config)
+        (tmp / "aws_config").write_text("[default]\nregion = eu-west-1\n")
+        (tmp / "aws_credentials").write_text("[default]\naws_access_key_id = bench\naws_secret_access_key = bench\n")
+
+        env = {
+            "XDG_CONFIG_HOME": str(tmp / "config"),
+            "XDG_CACHE_HOME": str(tmp / "cache"),
+            "XDG_RUNTIME_DIR": str(tmp / "runtime"),
+            "AWS_CONFIG_FILE": str(tmp / "aws_config"),
+            "AWS_SHARED_CREDENTIALS_FILE": str(tmp / "aws_credentials"),
+            "AWS_EC2_METADATA_DISABLED": "true",
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])),
+        }
+        (tmp / "runtime").mkdir(mode=0o700)
+
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            yield dict(os.environ)
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+
+def generate_hostkey():
+    """ proxycommand needs a host key, the smallest one keeps the benchmark about ssm-cli not RSA """
+    import paramiko
+    from ssm_cli.xdg import get_ssh_hostkey
+
+    path = get_ssh_hostkey(False)
+    if not path.exists():
+        paramiko.RSAKey.generate(1024).write_private_key_file(path)
+    return path
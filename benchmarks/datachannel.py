@@ -0,0 +1,95 @@
+"""
+The native data channel (actions.proxycommand.transport: native) against the local stand-in for the SSM
+endpoint and agent. Measures opening a channel, a one byte round trip and echo throughput, the lossy run
+drops every Nth message at the agent so the client has to resend.
+
+    python -m benchmarks.datachannel --megabytes 4
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from benchmarks.common import isolated_env, summarize
+from benchmarks.fakes import FakeDataChannelServer, FakeSession, start_echo_server
+
+CONFIG = "group_tag_key: group\n"
+
+
+def open_channel(session, echo: tuple):
+    from ssm_cli.instances import Instance
+
+    instance = Instance("i-0fake", "fake", "127.0.0.1", "Online")
+    return instance.start_port_forwarding_data_channel(session, *echo)
+
+
+def echo_through(sock, megabytes: int) -> float:
+    """ Seconds to send megabytes through and read them back """
+    payload = bytes(range(256)) * 4096
+    total = megabytes * len(payload)
+
+    def write():
+        for _ in range(megabytes):
+            sock.sendall(payload)
+    writer = threading.Thread(target=write)
+
+    start = time.perf_counter()
+    writer.start()
+    received = 0
+    while received < total:
+        data = sock.recv(65536)
+        if not data:
+            raise RuntimeError("data channel closed early")
+        received += len(data)
+    elapsed = time.perf_counter() - start
+    writer.join()
+    return elapsed
+
+
+def run(repeat: int = 10, megabytes: int = 4, drop_every: int = 50) -> dict:
+    with isolated_env(CONFIG):
+        from confclasses import load_config
+        from ssm_cli.config import config
+
+        load_config(config, CONFIG)
+        echo = start_echo_server()
+        results = {}
+        for name, drop in (("clean", 0), ("lossy", drop_every)):
+            session = FakeSession(FakeDataChannelServer(drop))
+            opens, round_trips = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                channel = open_channel(session, echo)
+                opens.append((time.perf_counter() - start) * 1000)
+
+                sock = channel.socket()
+                start = time.perf_counter()
+                sock.sendall(b"x")
+                sock.recv(1)
+                round_trips.append((time.perf_counter() - start) * 1000)
+                sock.close()
+
+            sock = open_channel(session, echo).socket()
+            elapsed = echo_through(sock, megabytes)
+            sock.close()
+            results[name] = {
+                "open_ms": summarize(opens),
+                "round_trip_ms": summarize(round_trips),
+                "echo_mb_per_s": megabytes / elapsed,
+            }
+        return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--megabytes", type=int, default=4)
+    parser.add_argument("--drop-every", type=int, default=50, help="the lossy run drops every Nth message")
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.repeat, args.megabytes, args.drop_every), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+"""
+Local stand-ins for AWS and the session-manager-plugin.
+
+    python -m benchmarks.fakes plugin <plugin args>   behaves like session-manager-plugin for port forwarding
+    python -m benchmarks.fakes proxycommand           runs ProxyCommandCommand on stdio against the fakes
+    python -m benchmarks.fakes direct <engine>        runs SshServer on stdio, channels connect straight to their destination
+"""
+import json
+import os
+import select
+import socket
+import stat
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Tuple
+
+from benchmarks.common import REPO_ROOT
+
+
+def pipe(a: socket.socket, b: socket.socket, chunk_size: int = 65536):
+    """ Copy both ways until either side closes """
+    try:
+        while True:
+            r, _, _ = select.select([a, b], [], [])
+            for src in r:
+                data = src.recv(chunk_size)
+                if not data:
+                    return
+                (b if src is a else a).sendall(data)
+    except OSError:
+        pass
+    finally:
+        a.close()
+        b.close()
+
+
+def _serve(listener: socket.socket, handler):
+    def accept_loop():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=handler, args=(conn,), daemon=True).start()
+    threading.Thread(target=accept_loop, daemon=True).start()
+
+
+def start_echo_server() -> Tuple[str, int]:
+    """ Echoes everything back, used to measure round trips through the proxy """
+    def echo(conn):
+        with conn:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    return
+                conn.sendall(data)
+
+    listener = socket.create_server(("127.0.0.1", 0))
+    _serve(listener, echo)
+    return listener.getsockname()
+
+
+def start_sink_server() -> Tuple[str, int]:
+    """
+    Reads an 8 byte length, then discards that many bytes and replies with the count as text. The plugin closes
+    the connection on a half close rather than passing it on, so the client says up front how much is coming.
+    """
+    def sink(conn):
+        with conn:
+            header = b""
+            while len(header) < 8:
+                data = conn.recv(8 - len(header))
+                if not data:
+                    return
+                header += data
+            expected = int.from_bytes(header, "big")
+            total = 0
+            while total < expected:
+                data = conn.recv(min(1 << 20, expected - total))
+                if not data:
+                    break
+                total += len(data)
+            conn.sendall(str(total).encode())
+
+    listener = socket.create_server(("127.0.0.1", 0))
+    _serve(listener, sink)
+    return listener.getsockname()
+
+
+def install_fake_plugin(bin_dir: Path) -> Path:
+    """ Puts a session-manager-plugin on a PATH dir that runs the fake plugin below """
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    path = bin_dir / "session-manager-plugin"
+    path.write_text(f'#!/bin/sh\nPYTHONPATH="{REPO_ROOT}" exec "{sys.executable}" -m benchmarks.fakes plugin "$@"\n')
+    path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def fake_plugin(argv: list):
+    """
+    Same argv and stdout as session-manager-plugin for AWS-StartPortForwardingSessionToRemoteHost, but the
+    "remote" host:port is reached directly. FAKE_PLUGIN_DELAY adds startup latency in seconds.
+    """
+    session = json.loads(argv[0])
+    parameters = json.loads(argv[4])["Parameters"]
+    host = parameters["host"][0]
+    port = int(parameters["portNumber"][0])
+    local_port = int(parameters.get("localPortNumber", ["0"])[0])
+
+    # the real plugin is left running by its parent too, make sure benchmark runs do not pile them up
+    parent = os.getppid()
+    def exit_with_parent():
+        while os.getppid() == parent:
+            time.sleep(0.5)
+        os._exit(0)
+    threading.Thread(target=exit_with_parent, daemon=True).start()
+
+    time.sleep(float(os.environ.get("FAKE_PLUGIN_DELAY", "0")))
+    listener = socket.create_server(("127.0.0.1", local_port))
+    local_port = listener.getsockname()[1]
+
+    print(f"\nStarting session with SessionId: {session['SessionId']}")
+    print(f"Port {local_port} opened for sessionId {session['SessionId']}.")
+    print("Waiting for connections...", flush=True)
+
+    while True:
+        conn, _ = listener.accept()
+        print("\nConnection accepted for session [{}]".format(session["SessionId"]), flush=True)
+        upstream = socket.create_connection((host, port))
+        threading.Thread(target=pipe, args=(conn, upstream), daemon=True).start()
+
+
+class FakeDataChannelServer:
+    """
+    Stands in for the SSM data channel endpoint and the agent behind it, for port sessions. Speaks the
+    websocket and ClientMessage protocol, does the handshake and acks, then connects to host:port itself.
+    drop_every makes it ignore every Nth input message so the client has to resend it.
+    """
+    def __init__(self, drop_every: int = 0):
+        self.drop_every = drop_every
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.url = f"ws://127.0.0.1:{self.listener.getsockname()[1]}"
+        self.sessions = 0
+        _serve(self.listener, self._session)
+
+    def stream_url(self, session_id: str, host: str, port: int) -> str:
+        return f"{self.url}/v1/data-channel/{session_id}?host={host}&port={port}"
+
+    def _session(self, conn: socket.socket):
+        from urllib.parse import parse_qs, urlsplit
+        from ssm_cli.datachannel.websocket import OP_TEXT, WebSocket, accept_key, read_http_head
+
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        request, headers = read_http_head(conn)
+        conn.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept_key(headers['sec-websocket-key'])}\r\n"
+            "\r\n"
+        ).encode())
+        ws = WebSocket(conn, mask=False)
+        opcode, data = ws.recv()
+        if opcode != OP_TEXT or json.loads(data)["TokenValue"] != "token":
+            ws.close()
+            return
+
+        query = parse_qs(urlsplit(request.split()[1]).query)
+        self.sessions += 1
+        FakeAgentSession(ws, query["host"][0], int(query["port"][0]), self.drop_every).run()
+
+
+class FakeAgentSession:
+    def __init__(self, ws, host: str, port: int, drop_every: int):
+        self.ws = ws
+        self.host = host
+        self.port = port
+        self.drop_every = drop_every
+        self.target = None
+        self.received = 0
+        self.expected = 0
+        self.out_of_order = {}
+        self.sequence = 0
+        self.send_lock = threading.Lock()
+
+    def run(self):
+        from ssm_cli.datachannel import message as msg
+        from ssm_cli.datachannel.message import ClientMessage
+        from ssm_cli.datachannel.websocket import WebSocketClosed
+
+        self.send_output(json.dumps({
+            "AgentVersion": "3.3.0.0",
+            "RequestedClientActions": [{
+                "ActionType": "SessionType",
+                "ActionParameters": {"SessionType": "Port", "Properties": {"portNumber": str(self.port), "type": "LocalPortForwarding"}},
+            }],
+        }).encode(), msg.HANDSHAKE_REQUEST)
+
+        try:
+            while True:
+                _, data = self.ws.recv()
+                message = ClientMessage.deserialize(data)
+                if message.message_type != msg.INPUT_STREAM_DATA:
+                    continue
+                self.received += 1
+                if self.drop_every and self.received % self.drop_every == 0:
+                    continue
+                self.ws.send(ClientMessage(msg.ACKNOWLEDGE, 0, json.dumps({
+                    "AcknowledgedMessageType": message.message_type,
+                    "AcknowledgedMessageId": str(message.message_id),
+                    "AcknowledgedMessageSequenceNumber": message.sequence_number,
+                    "IsSequentialMessage": True,
+                }).encode(), payload_type=0, flags=msg.FLAG_ACK).serialize())
+
+                if message.sequence_number < self.expected:
+                    continue
+                self.out_of_order[message.sequence_number] = message
+                while self.expected in self.out_of_order:
+                    if not self.deliver(self.out_of_order.pop(self.expected)):
+                        return
+                    self.expected += 1
+        except (WebSocketClosed, OSError):
+            pass
+        finally:
+            if self.target is not None:
+                self.target.close()
+            self.ws.close()
+
+    def deliver(self, message) -> bool:
+        from ssm_cli.datachannel import message as msg
+
+        if message.payload_type == msg.HANDSHAKE_RESPONSE:
+            self.target = socket.create_connection((self.host, self.port))
+            self.send_output(json.dumps({"HandshakeTimeToComplete": 1000000, "CustomerMessage": ""}).encode(), msg.HANDSHAKE_COMPLETE)
+            threading.Thread(target=self.read_target, daemon=True).start()
+        elif message.payload_type == msg.OUTPUT:
+            self.target.sendall(message.payload)
+        elif message.payload_type == msg.FLAG:
+            self.close_channel()
+            return False
+        return True
+
+    def read_target(self):
+        try:
+            while True:
+                data = self.target.recv(4096)
+                if not data:
+                    break
+                self.send_output(data)
+            self.close_channel()
+        except OSError:
+            pass
+
+    def send_output(self, payload: bytes, payload_type: int = 1):
+        from ssm_cli.datachannel import message as msg
+        from ssm_cli.datachannel.message import ClientMessage
+
+        with self.send_lock:
+            self.ws.send(ClientMessage(msg.OUTPUT_STREAM_DATA, self.sequence, payload, payload_type).serialize())
+            self.sequence += 1
+
+    def close_channel(self):
+        from ssm_cli.datachannel import message as msg
+        from ssm_cli.datachannel.message import ClientMessage
+
+        try:
+            self.ws.send(ClientMessage(msg.CHANNEL_CLOSED, 0, json.dumps({"Output": "session closed"}).encode(), payload_type=0).serialize())
+        except OSError:
+            pass
+        self.ws.close()
+
+
+class FakeSsmClient:
+    """ latencies adds a delay in seconds to StartSession per target, to stand in for slower instances """
+    def __init__(self, datachannel: FakeDataChannelServer = None, latencies: dict = None):
+        self.calls = 0
+        self.datachannel = datachannel
+        self.latencies = latencies or {}
+        self._lock = threading.Lock()
+
+    def start_session(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+            session_id = f"fake-{os.getpid()}-{self.calls}"
+        time.sleep(self.latencies.get(kwargs["Target"], 0))
+        stream_url = "wss://localhost/fake"
+        if self.datachannel is not None:
+            parameters = kwargs["Parameters"]
+            stream_url = self.datachannel.stream_url(session_id, parameters["host"][0], parameters["portNumber"][0])
+        return {"SessionId": session_id, "TokenValue": "token", "StreamUrl": stream_url}
+
+    def terminate_session(self, SessionId):
+        return {"SessionId": SessionId}
+
+
+class FakeSession:
+    """ Just enough of boto3.Session for the connection code paths """
+    profile_name = "default"
+    region_name = "eu-west-1"
+
+    def __init__(self, datachannel: FakeDataChannelServer = None, latencies: dict = None):
+        self._ssm = FakeSsmClient(datachannel, latencies)
+
+    def client(self, name, **kwargs):
+        if name != "ssm":
+            raise ValueError(f"fake session has no {name} client")
+        return self._ssm
+
+
+class FakeInstances:
+    def __init__(self, session):
+        from ssm_cli.instances import Instance
+        self.session = session
+        self.instance = Instance("i-0fake", "fake", "127.0.0.1", "Online")
+
+    def select_instance(self, group_tag_value, selector):
+        return self.instance
+
+    def session_for(self, instance):
+        return self.session
+
+
+def fake_daemon():
+    """ A Daemon serving FakeInstances through FakeSession, config has to be loaded already """
+    from ssm_cli.daemon import Daemon
+
+    class FakeDaemon(Daemon):
+        fake_session = FakeSession()
+
+        def session(self, profile, region):
+            return self.fake_session
+
+        def instances(self, session, refresh):
+            return FakeInstances(session)
+
+    return FakeDaemon()
+
+
+def fake_proxycommand():
+    """ ProxyCommandCommand.run on stdio with a fake session and inventory, the fake plugin must be on PATH """
+    import argparse
+    from confclasses import load_config
+    from ssm_cli.config import config
+    from ssm_cli.xdg import get_conf_file
+    import ssm_cli.commands.proxycommand as proxycommand
+
+    # cli() has always imported boto3 by the time a command runs, do the same so its cost lands where it would
+    import boto3  # noqa: F401
+
+    with open(get_conf_file(), "r") as file:
+        load_config(config, file)
+    proxycommand.get_instances = lambda session, refresh=False: FakeInstances(session)
+
+    args = argparse.Namespace(group="bench", global_args=argparse.Namespace(refresh=False))
+    proxycommand.ProxyCommandCommand.run(args, FakeSession())
+
+
+def direct_server(engine: str):
+    """ SshServer on stdio connecting channels straight to their destination, no AWS or plugin involved """
+    import socket
+    from ssm_cli.ssh.server import SshServer
+
+    SshServer(lambda host, port: socket.create_connection((host, port)), engine).start()
+
+
+if __name__ == "__main__":
+    if sys.argv[1] == "plugin":
+        fake_plugin(sys.argv[2:])
+    elif sys.argv[1] == "proxycommand":
+        fake_proxycommand()
+    elif sys.argv[1] == "direct":
+        direct_server(sys.argv[2])
+    else:
+        sys.exit(f"unknown fake {sys.argv[1]}")
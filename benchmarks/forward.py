@@ -0,0 +1,98 @@
+"""
+Bulk throughput of the forwarding engines against a local echo server. SshServer runs in process over a
+socketpair, so this measures the channel <-> socket pump rather than the plugin or stdio.
+
+    python -m benchmarks.forward --megabytes 32 --channels 1 4
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+from benchmarks.common import isolated_env, generate_hostkey
+from benchmarks.fakes import start_echo_server
+
+ENGINES = ["thread", "asyncio"]
+
+
+def start_server(engine: str):
+    """ Client transport connected to an in process SshServer that forwards straight to the destination """
+    import paramiko
+    from ssm_cli.ssh.server import SshServer
+
+    client_sock, server_sock = socket.socketpair()
+    server = SshServer(lambda host, port: socket.create_connection((host, port)), engine)
+    threading.Thread(target=server.start, args=(server_sock,), daemon=True).start()
+
+    transport = paramiko.Transport(client_sock)
+    transport.start_client(timeout=30)
+    transport.auth_none("bench")
+    return transport
+
+
+def echo_through(chan, payload: bytes):
+    """ Writes the payload while reading the echo back, then checks the half close comes back too """
+    writer = threading.Thread(target=chan.sendall, args=(payload,))
+    writer.start()
+    received = 0
+    while received < len(payload):
+        data = chan.recv(1 << 20)
+        if not data:
+            raise RuntimeError(f"channel closed after {received} of {len(payload)} bytes")
+        received += len(data)
+    writer.join()
+    chan.shutdown_write()
+    chan.recv(1)
+    chan.close()
+
+
+def throughput(engine: str, channels: int, megabytes: int, echo: tuple) -> dict:
+    transport = start_server(engine)
+    try:
+        chans = [transport.open_channel("direct-tcpip", echo, ("127.0.0.1", 0), timeout=30) for _ in range(channels)]
+        payload = os.urandom(megabytes * 1024 * 1024 // channels)
+
+        cpu = time.process_time()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=echo_through, args=(chan, payload)) for chan in chans]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+    finally:
+        transport.close()
+
+    # echoed, so every byte went through the pump twice
+    total_mb = 2 * len(payload) * channels / (1024 * 1024)
+    return {"mb_per_s": total_mb / elapsed, "cpu_s_per_mb": cpu / total_mb, "seconds": elapsed}
+
+
+def run(megabytes: int = 32, channel_counts: list = None) -> dict:
+    # closing the client transport mid read makes paramiko log resets we do not care about
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    with isolated_env():
+        generate_hostkey()
+        echo = start_echo_server()
+        return {
+            engine: {f"channels_{n}": throughput(engine, n, megabytes, echo) for n in channel_counts or [1, 4]}
+            for engine in ENGINES
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--megabytes", type=int, default=32)
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.megabytes, args.channels), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
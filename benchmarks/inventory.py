@@ -0,0 +1,253 @@
+"""
+Inventory lookups through Instances against botocore Stubber, no network involved. Synthetic fleets of each
+size are fed through list_groups, list_instances and select_instance, reporting wall time, the tracemalloc peak
+while the call runs and the blocks/bytes still held afterwards (the result), each per instance. botocore sets up
+paginators and the like on first use, for small fleets that fixed cost shows up in the per instance figures.
+The records section compares Instance against the plain dataclass and regex ip sort it replaced, memory per
+instance when rebuilt from cached rows and time to sort the fleet by ip.
+
+    python -m benchmarks.inventory --instances 1000 10000 100000
+"""
+import argparse
+import gc
+import json
+import random
+import re
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, Iterator, List
+
+from benchmarks.common import isolated_env, summarize
+
+CONFIG = "group_tag_key: group\ncache:\n  enabled: false\n"
+TAGGING_PAGE_SIZE = 100
+SSM_PAGE_SIZE = 50
+# list_groups sees the whole fleet spread over this many groups
+GROUPS = 50
+# tags real instances tend to carry ahead of the ones we look for, so the tag scans have something to skip
+FILLER_TAGS = [
+    ("aws:cloudformation:stack-name", "bench-stack"),
+    ("aws:cloudformation:logical-id", "BenchInstance"),
+    ("aws:autoscaling:groupName", "bench-asg"),
+    ("Environment", "bench"),
+    ("Owner", "platform"),
+    ("CostCentre", "1234"),
+]
+
+
+def instance_ids(count: int) -> List[str]:
+    return [f"i-{n:017x}" for n in range(count)]
+
+
+def resource_pages(ids: List[str], groups: int = 1) -> Iterator[dict]:
+    for start in range(0, len(ids), TAGGING_PAGE_SIZE):
+        end = start + TAGGING_PAGE_SIZE
+        yield {
+            "ResourceTagMappingList": [
+                {
+                    "ResourceARN": f"arn:aws:ec2:eu-west-1:123456789012:instance/{id}",
+                    "Tags": [
+                        *({"Key": key, "Value": value} for key, value in FILLER_TAGS),
+                        {"Key": "group", "Value": "bench" if groups == 1 else f"bench-{n % groups}"},
+                        {"Key": "Name", "Value": f"bench-{id}"},
+                    ],
+                }
+                for n, id in enumerate(ids[start:end], start)
+            ],
+            "PaginationToken": str(end) if end < len(ids) else "",
+        }
+
+
+def instance_information_pages(ids: List[str]) -> Iterator[dict]:
+    for start in range(0, len(ids), SSM_PAGE_SIZE):
+        end = start + SSM_PAGE_SIZE
+        page = {
+            "InstanceInformationList": [
+                {
+                    "InstanceId": id,
+                    "IPAddress": f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}",
+                    "PingStatus": "Online" if n % 10 else "ConnectionLost",
+                }
+                for n, id in enumerate(ids[start:end], start)
+            ]
+        }
+        if end < len(ids):
+            page["NextToken"] = str(end)
+        yield page
+
+
+def stubbed_session(ids: List[str], groups: int = 1, with_ssm: bool = True):
+    """ A real boto3 session whose ssm/tagging clients replay the synthetic pages once """
+    import boto3
+    from botocore.stub import Stubber
+
+    session = boto3.Session(region_name="eu-west-1")
+    clients = {
+        "ssm": session.client("ssm"),
+        "resourcegroupstaggingapi": session.client("resourcegroupstaggingapi"),
+    }
+    ssm = Stubber(clients["ssm"])
+    if with_ssm:
+        for page in instance_information_pages(ids):
+            ssm.add_response("describe_instance_information", page)
+    tagging = Stubber(clients["resourcegroupstaggingapi"])
+    for page in resource_pages(ids, groups):
+        tagging.add_response("get_resources", page)
+    ssm.activate()
+    tagging.activate()
+
+    session.client = lambda name, **kwargs: clients[name]
+    return session
+
+
+def measure(call: Callable[[object], object], make_session: Callable[[], object], instances: int, repeat: int) -> dict:
+    """
+    Times call(session) repeat times, then runs it once more under tracemalloc. Sessions are stubbed outside
+    of the timing, each call needs its own fresh responses.
+    """
+    samples = []
+    for _ in range(repeat):
+        session = make_session()
+        start = time.perf_counter()
+        call(session)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    session = make_session()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        result = call(session)
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = [stat for stat in after.compare_to(before, "filename") if stat.size_diff > 0]
+    del result
+
+    return {
+        "wall_ms": summarize(samples),
+        "peak_bytes": peak,
+        "peak_bytes_per_instance": peak / instances,
+        "retained_bytes_per_instance": sum(stat.size_diff for stat in retained) / instances,
+        "retained_blocks_per_instance": sum(stat.count_diff for stat in retained) / instances,
+    }
+
+
+@dataclass
+class DataclassInstance:
+    """ Instance as it was, a dataclass with a dict per instance """
+    id: str
+    name: str
+    ip: str
+    ping: str
+    profile: str = None
+    region: str = None
+
+
+def regex_ip_key(instance) -> int:
+    """ The sort key select_instance used to work out on every sort """
+    m = re.match(r'(\d+)\.(\d+)\.(\d+)\.(\d+)', instance.ip)
+    return (int(m.group(1)) << 24) + (int(m.group(2)) << 16) + (int(m.group(3)) << 8) + int(m.group(4))
+
+
+def cached_rows(count: int) -> List[dict]:
+    """ Rows the way they come back out of the inventory cache, every string a separate object like json.loads gives """
+    return json.loads(json.dumps([
+        {
+            "id": id,
+            "name": f"bench-{id}",
+            "ip": f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}",
+            "ping": "Online" if n % 10 else "ConnectionLost",
+            "profile": "bench",
+            "region": "eu-west-1",
+        }
+        for n, id in enumerate(instance_ids(count))
+    ]))
+
+
+def record_bytes(make: Callable[[dict], object], rows: List[dict]) -> float:
+    """ Bytes per instance held by the records made from rows, on top of the rows themselves """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        records = [make(row) for row in rows]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del records
+    return (after - before) / len(rows)
+
+
+def records(instances: int, repeat: int) -> dict:
+    from ssm_cli.instances import Instance
+    from operator import attrgetter
+
+    rows = cached_rows(instances)
+    shuffled = [Instance(**row) for row in rows]
+    random.Random(0).shuffle(shuffled)
+    legacy = [DataclassInstance(**row) for row in rows]
+    random.Random(0).shuffle(legacy)
+
+    def timed(call: Callable[[], object]) -> dict:
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call()
+            samples.append((time.perf_counter() - start) * 1000)
+        return summarize(samples)
+
+    return {
+        "bytes_per_instance": record_bytes(lambda row: Instance(**row), rows),
+        "dataclass_bytes_per_instance": record_bytes(lambda row: DataclassInstance(**row), rows),
+        "build_ms": timed(lambda: [Instance(**row) for row in rows]),
+        "dataclass_build_ms": timed(lambda: [DataclassInstance(**row) for row in rows]),
+        "sort_ms": timed(lambda: sorted(shuffled, key=attrgetter('sort_key'))),
+        "regex_sort_ms": timed(lambda: sorted(legacy, key=regex_ip_key)),
+    }
+
+
+def fleet(instances: int, repeat: int) -> dict:
+    from ssm_cli.instances import Instances
+
+    ids = instance_ids(instances)
+    return {
+        "list_groups": measure(
+            lambda session: Instances(session).list_groups(),
+            lambda: stubbed_session(ids, GROUPS, with_ssm=False), instances, repeat
+        ),
+        "list_instances": measure(
+            lambda session: Instances(session).list_instances("bench"),
+            lambda: stubbed_session(ids), instances, repeat
+        ),
+        "select_instance": measure(
+            lambda session: Instances(session).select_instance("bench", "first"),
+            lambda: stubbed_session(ids), instances, repeat
+        ),
+        "records": records(instances, repeat),
+    }
+
+
+def run(instances=(1000, 10000, 100000), repeat: int = 3) -> dict:
+    with isolated_env(CONFIG):
+        from confclasses import load_config
+        from ssm_cli.config import config
+
+        load_config(config, CONFIG)
+        return {str(count): fleet(count, repeat) for count in instances}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--instances", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.instances, args.repeat), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
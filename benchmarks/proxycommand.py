@@ -0,0 +1,249 @@
+"""
+Time from starting `ssm proxycommand` to a finished SSH handshake, and from there to the first byte back
+through a forwarded channel. Runs ProxyCommandCommand with a fake session and the fake session-manager-plugin.
+The warm_pool results repeat this with a slow plugin, with and without the destination in actions.proxycommand.warm.
+The daemon results go through `ssm proxycommand` as a thin client of a daemon kept running between connections.
+
+throughput pushes bulk data through one channel to a sink (one way) and an echo server (both ways), with the CPU
+seconds per MB of this process (the ssh client side) and of the proxycommand and its plugin. channel_open opens
+1/10/100 channels at once. Both run once the port forward is up, so they measure the forwarding path not its startup.
+
+    python -m benchmarks.proxycommand --repeat 5 --megabytes 32 --concurrency 1,10,100
+"""
+import argparse
+import json
+import logging
+import os
+import shlex
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from benchmarks.channels import open_many
+from benchmarks.common import isolated_env, generate_hostkey, process_tree_cpu, summarize
+from benchmarks.fakes import install_fake_plugin, start_echo_server, start_sink_server
+from benchmarks.forward import echo_through
+
+
+FAKE_PROXYCOMMAND = f"{shlex.quote(sys.executable)} -m benchmarks.fakes proxycommand"
+# the real cli, with daemon.enabled it only passes stdio through to the daemon
+DAEMON_PROXYCOMMAND = f"{shlex.quote(sys.executable)} -m ssm_cli proxycommand bench"
+
+
+def connect(command: str = FAKE_PROXYCOMMAND):
+    """ paramiko client talking to a fresh proxycommand over its stdio """
+    import paramiko
+
+    sock = paramiko.ProxyCommand(command)
+    transport = paramiko.Transport(sock)
+    transport.start_client(timeout=30)
+    transport.auth_none("bench")
+    return transport
+
+
+def handshake_to_first_byte(echo: tuple, command: str = FAKE_PROXYCOMMAND) -> dict:
+    start = time.perf_counter()
+    transport = connect(command)
+    handshake = time.perf_counter()
+    try:
+        chan = transport.open_channel("direct-tcpip", echo, ("127.0.0.1", 0), timeout=30)
+        chan.sendall(b"x")
+        if chan.recv(1) != b"x":
+            raise RuntimeError("echo did not come back")
+        first_byte = time.perf_counter()
+        chan.close()
+
+        # a second channel to the same destination, which can reuse the running port forward
+        chan = transport.open_channel("direct-tcpip", echo, ("127.0.0.1", 0), timeout=30)
+        chan.sendall(b"y")
+        if chan.recv(1) != b"y":
+            raise RuntimeError("echo did not come back")
+        second_byte = time.perf_counter()
+        chan.close()
+    finally:
+        transport.close()
+    return {
+        "handshake": (handshake - start) * 1000,
+        "first_byte": (first_byte - handshake) * 1000,
+        "total": (first_byte - start) * 1000,
+        "second_channel_first_byte": (second_byte - first_byte) * 1000,
+    }
+
+
+def small_packets(echo: tuple, count: int = 5000, size: int = 64) -> dict:
+    """ Many small writes, each one is its own SSH packet through the stdio transport both ways """
+    transport = connect()
+    try:
+        chan = transport.open_channel("direct-tcpip", echo, ("127.0.0.1", 0), timeout=30)
+        payload = b"x" * size
+        expected = count * size
+
+        def write():
+            for _ in range(count):
+                chan.sendall(payload)
+        writer = threading.Thread(target=write)
+
+        start = time.perf_counter()
+        writer.start()
+        received = 0
+        while received < expected:
+            data = chan.recv(65536)
+            if not data:
+                raise RuntimeError("channel closed early")
+            received += len(data)
+        elapsed = time.perf_counter() - start
+        writer.join()
+        chan.close()
+    finally:
+        transport.close()
+    return {"packets_per_s": count / elapsed, "seconds": elapsed}
+
+
+def start_forward(transport, destination: tuple):
+    """ The proxycommand only answers a channel open once its port forward accepts connections """
+    transport.open_channel("direct-tcpip", destination, ("127.0.0.1", 0), timeout=30).close()
+
+
+def bulk_transfer(destination: tuple, megabytes: int, echoed: bool) -> dict:
+    transport = connect()
+    try:
+        start_forward(transport, destination)
+        chan = transport.open_channel("direct-tcpip", destination, ("127.0.0.1", 0), timeout=30)
+        proxy_pid = transport.sock.process.pid
+        payload = os.urandom(megabytes * 1024 * 1024)
+
+        cpu = time.process_time()
+        proxy_cpu = process_tree_cpu(proxy_pid)
+        start = time.perf_counter()
+        if echoed:
+            echo_through(chan, payload)
+        else:
+            sink_through(chan, payload)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        if proxy_cpu is not None:
+            proxy_cpu = process_tree_cpu(proxy_pid) - proxy_cpu
+    finally:
+        transport.close()
+
+    # echoed, so every byte went through the proxy twice
+    total_mb = (2 if echoed else 1) * len(payload) / (1024 * 1024)
+    return {
+        "mb_per_s": total_mb / elapsed,
+        "client_cpu_s_per_mb": cpu / total_mb,
+        "proxy_cpu_s_per_mb": None if proxy_cpu is None else proxy_cpu / total_mb,
+        "seconds": elapsed,
+    }
+
+
+def sink_through(chan, payload: bytes, chunk_size: int = 1024 * 1024):
+    expected = str(len(payload)).encode()
+    chan.sendall(len(payload).to_bytes(8, "big"))
+    view = memoryview(payload)
+    for offset in range(0, len(payload), chunk_size):
+        chan.sendall(view[offset:offset + chunk_size])
+    reply = b""
+    while len(reply) < len(expected):
+        data = chan.recv(64)
+        if not data:
+            break
+        reply += data
+    chan.close()
+    if reply != expected:
+        raise RuntimeError(f"sink got {reply.decode() or 0} of {len(payload)} bytes")
+
+
+def channel_open(echo: tuple, concurrency) -> dict:
+    results = {}
+    for count in concurrency:
+        transport = connect()
+        try:
+            start_forward(transport, echo)
+            results[str(count)] = open_many(transport, echo, count)
+        finally:
+            transport.close()
+    return results
+
+
+def first_byte_samples(echo: tuple, repeat: int, command: str = FAKE_PROXYCOMMAND) -> dict:
+    samples = {}
+    for _ in range(repeat):
+        for phase, value in handshake_to_first_byte(echo, command).items():
+            samples.setdefault(phase, []).append(value)
+    return {f"{phase}_ms": summarize(values) for phase, values in samples.items()}
+
+
+@contextmanager
+def proxycommand_env(config: str = "group_tag_key: group\n", plugin_delay: float = 0):
+    with isolated_env(config) as env:
+        generate_hostkey()
+        bin_dir = Path(env["XDG_RUNTIME_DIR"]) / "bin"
+        install_fake_plugin(bin_dir)
+        path = os.environ["PATH"]
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{path}"
+        os.environ["FAKE_PLUGIN_DELAY"] = str(plugin_delay)
+        try:
+            yield
+        finally:
+            os.environ["PATH"] = path
+            del os.environ["FAKE_PLUGIN_DELAY"]
+
+
+def run(repeat: int = 5, plugin_delay: float = 0.5, megabytes: int = 32, concurrency=(1, 10, 100)) -> dict:
+    # closing the client transport mid read makes paramiko log resets we do not care about
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    echo = start_echo_server()
+    sink = start_sink_server()
+    with proxycommand_env():
+        results = first_byte_samples(echo, repeat)
+        results["small_packets"] = small_packets(echo)
+        results["throughput"] = {
+            "sink": bulk_transfer(sink, megabytes, echoed=False),
+            "echo": bulk_transfer(echo, megabytes, echoed=True),
+        }
+        results["channel_open"] = channel_open(echo, concurrency)
+
+    warm_config = f"group_tag_key: group\nactions:\n  proxycommand:\n    warm: ['{echo[0]}:{echo[1]}']\n"
+    results["warm_pool"] = {}
+    for name, config in (("cold", "group_tag_key: group\n"), ("warm", warm_config)):
+        with proxycommand_env(config, plugin_delay):
+            results["warm_pool"][name] = first_byte_samples(echo, repeat)
+    results["daemon"] = daemon_samples(echo, repeat)
+    return results
+
+
+def daemon_samples(echo: tuple, repeat: int) -> dict:
+    """ Repeat connections through an in process fake daemon, the first one also starts the port forward """
+    from confclasses import load_config
+    from ssm_cli.config import config
+    from benchmarks.fakes import fake_daemon
+
+    daemon_config = "group_tag_key: group\ndaemon:\n  enabled: true\n"
+    with proxycommand_env(daemon_config):
+        load_config(config, daemon_config)
+        daemon = fake_daemon()
+        server = threading.Thread(target=daemon.serve, daemon=True)
+        server.start()
+        try:
+            return first_byte_samples(echo, repeat, DAEMON_PROXYCOMMAND)
+        finally:
+            daemon.stop()
+            server.join()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--plugin-delay", type=float, default=0.5, help="fake plugin startup seconds for the warm_pool runs")
+    parser.add_argument("--megabytes", type=int, default=32, help="bulk transfer size for the throughput runs")
+    parser.add_argument("--concurrency", default="1,10,100", help="comma separated numbers of channels opened at once")
+    args = parser.parse_args(argv)
+    concurrency = [int(count) for count in args.concurrency.split(",")]
+    print(json.dumps(run(args.repeat, args.plugin_delay, args.megabytes, concurrency), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Keystroke latency of the search selector. Each key narrows the previous matches and redraws the visible window,
+this times both for a few typed queries over synthetic instances, plus building the index and backspacing.
+Anything over 16ms a key drops a frame.
+
+    python -m benchmarks.search --instances 10000
+"""
+import argparse
+import io
+import json
+import sys
+import time
+
+from benchmarks.common import summarize, time_calls
+
+QUERIES = ["web", "i-0000000000000ff", "10.0.3", "bench-i-00000000000000123"]
+
+
+def synthetic_instances(count: int) -> list:
+    from ssm_cli.instances import Instance
+
+    return [
+        Instance(f"i-{n:017x}", f"{('web', 'db', 'cache', 'worker')[n % 4]}-{n}.bench", f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}", "Online")
+        for n in range(count)
+    ]
+
+
+def run(instances: int = 10000) -> dict:
+    import blessed
+    from ssm_cli.selectors.search import SearchIndex, SearchView, render
+
+    fleet = synthetic_instances(instances)
+    term = blessed.Terminal(kind="xterm-256color", stream=io.StringIO(), force_styling=True)
+    index = SearchIndex(fleet)
+    view = SearchView(index, 40)
+
+    keys = []
+    backspaces = []
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        for query in QUERIES:
+            for char in query:
+                start = time.perf_counter()
+                index.push(char)
+                view.reset()
+                render(term, view)
+                keys.append((time.perf_counter() - start) * 1000)
+            for _ in query:
+                start = time.perf_counter()
+                index.pop()
+                view.reset()
+                render(term, view)
+                backspaces.append((time.perf_counter() - start) * 1000)
+            sys.stdout = io.StringIO()
+    finally:
+        sys.stdout = stdout
+
+    return {
+        "instances": instances,
+        "build_index_ms": time_calls(lambda: SearchIndex(fleet), 5),
+        "keystroke_ms": summarize(keys),
+        "backspace_ms": summarize(backspaces),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--instances", type=int, default=10000)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.instances), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Instance selectors that do more than pick from the list. fastest is run the way repeated proxycommands use it,
+each run connects through the instance it picked over a native data channel to fake instances that take different
+times to answer, until it has a time for each and then with that history. spread is run by many
+processes at once that all stay connected, then checks how evenly they landed and that nothing is left counted
+once they have exited.
+
+    python -m benchmarks.selectors --instances 20 --processes 200
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+from collections import Counter
+
+from benchmarks.common import isolated_env, summarize
+from benchmarks.fakes import FakeDataChannelServer, FakeSession, start_echo_server
+
+CONFIG = "group_tag_key: group\nactions:\n  proxycommand:\n    selector: fastest\n    transport: native\n"
+# gap between the fake instances' StartSession delays
+STEP = 0.01
+
+
+def fake_group(count: int) -> list:
+    from ssm_cli.instances import Instance
+
+    return [Instance(f"i-{n:017x}", f"bench-{n}", f"10.0.0.{n + 1}", "Online") for n in range(count)]
+
+
+def fastest(count: int, repeat: int) -> dict:
+    from ssm_cli.commands.proxycommand import native_tcpip_callback
+    from ssm_cli.selectors.fastest import scores, select
+
+    instances = fake_group(count)
+    # STEP apart, so the order is clear of the noise in the measurement
+    steps = random.sample(range(count), count)
+    latencies = {instance.id: 0.01 + STEP * step for instance, step in zip(instances, steps)}
+    fastest_latency = min(latencies.values())
+    session = FakeSession(FakeDataChannelServer(), latencies)
+    host, port = start_echo_server()
+    scores().path.unlink(missing_ok=True)
+
+    def connect():
+        """ One proxycommand run, pick then connect through the pick, which records how long that took """
+        start = time.perf_counter()
+        chosen = select(instances)
+        elapsed = (time.perf_counter() - start) * 1000
+        sock = native_tcpip_callback(chosen, session)(host, port)
+        if sock is None:
+            raise RuntimeError(f"connecting through {chosen.id} failed")
+        sock.close()
+        return chosen, elapsed
+
+    learning = [connect() for _ in range(count)]
+    untried = {instance.id for instance in instances} - {chosen.id for chosen, _ in learning}
+    if untried:
+        raise RuntimeError(f"{len(untried)} instances never tried while learning")
+
+    picks = [connect() for _ in range(repeat)]
+    for chosen, _ in picks:
+        if latencies[chosen.id] - fastest_latency >= STEP:
+            raise RuntimeError(f"picked {chosen.id} at {latencies[chosen.id] * 1000:.0f}ms, fastest is {fastest_latency * 1000:.0f}ms")
+
+    return {
+        "instances": count,
+        "slowest_instance_ms": max(latencies.values()) * 1000,
+        "runs_to_learn": len(learning),
+        "learning_select_ms": summarize([elapsed for _, elapsed in learning]),
+        "select_ms": summarize([elapsed for _, elapsed in picks]),
+    }
+
+
+def spread_worker(config_text: str, instances: list, results, release):
+    """ One proxycommand's worth of spread, it keeps its assignment until told to exit """
+    from confclasses import load_config
+    from ssm_cli.config import config
+    from ssm_cli.selectors.spread import select
+
+    load_config(config, config_text)
+    start = time.perf_counter()
+    chosen = select(instances)
+    results.put((chosen.id, (time.perf_counter() - start) * 1000))
+    release.wait()
+
+
+def spread(count: int, processes: int, config_text: str) -> dict:
+    from ssm_cli.selectors.spread import Assignments
+
+    instances = fake_group(count)
+    context = multiprocessing.get_context()
+    results = context.Queue()
+    release = context.Event()
+    workers = [context.Process(target=spread_worker, args=(config_text, instances, results, release)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    picks = [results.get(timeout=120) for _ in workers]
+    release.set()
+    for worker in workers:
+        worker.join()
+
+    per_instance = Counter(id for id, _ in picks)
+    return {
+        "instances": count,
+        "processes": processes,
+        "select_ms": summarize([elapsed for _, elapsed in picks]),
+        "most_on_one_instance": max(per_instance.values()),
+        "fewest_on_one_instance": min(per_instance.get(instance.id, 0) for instance in instances),
+        "left_after_exit": len(Assignments()._read()["assignments"]),
+    }
+
+
+def run(instances: int = 20, repeat: int = 5, processes: int = 200) -> dict:
+    with isolated_env(CONFIG):
+        from confclasses import load_config
+        from ssm_cli.config import config
+
+        load_config(config, CONFIG)
+        return {
+            "fastest": fastest(instances, repeat),
+            "spread": spread(instances, processes, CONFIG),
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--instances", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--processes", type=int, default=200, help="concurrent processes for spread")
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.instances, args.repeat, args.processes), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Startup cost of each command, split into the phases cli() goes through. Every ssh connection through
+proxycommand pays this, so it doubles as a regression check: it fails if the bare import pulls in a heavy
+module or goes over --budget-ms.
+
+    python -m benchmarks.startup --budget-ms 150
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks.common import isolated_env, summarize
+
+HEAVY_MODULES = ["boto3", "botocore", "paramiko", "inquirer", "rich"]
+COMMAND_ARGV = {
+    "list": ["list", "bench"],
+    "shell": ["shell", "bench"],
+    "proxycommand": ["proxycommand", "bench"],
+    "setup": ["setup"],
+}
+
+# Runs in a fresh interpreter, mirroring the steps in ssm_cli.cli.cli
+PROBE = """
+import json, sys, time
+argv = json.loads(sys.argv[1])
+heavy = json.loads(sys.argv[2])
+phases = {}
+
+start = time.perf_counter()
+import ssm_cli.cli
+from ssm_cli.commands import COMMANDS
+from ssm_cli.cli_args import CliArgumentParser
+phases["import"] = time.perf_counter() - start
+loaded = [m for m in heavy if m in sys.modules]
+
+start = time.perf_counter()
+parser = CliArgumentParser(prog="ssm")
+for name in COMMANDS:
+    command_parser = parser.add_command_parser(name, COMMANDS.help(name))
+    if name in argv:
+        COMMANDS[name].add_arguments(command_parser)
+args = parser.parse_args(argv)
+phases["argparse"] = time.perf_counter() - start
+
+start = time.perf_counter()
+from confclasses import load_config
+from ssm_cli.config import config
+from ssm_cli.xdg import get_conf_file
+with open(get_conf_file(), "r") as file:
+    load_config(config, file)
+    args.update_config()
+phases["config"] = time.perf_counter() - start
+
+if args.command != "setup":
+    start = time.perf_counter()
+    import boto3
+    boto3.Session()
+    phases["boto3_session"] = time.perf_counter() - start
+
+print(json.dumps({"phases_ms": {k: v * 1000 for k, v in phases.items()}, "loaded_by_import": loaded}))
+"""
+
+
+def measure(command: str, runs: int, env: dict) -> dict:
+    phases = {}
+    interpreter = []
+    loaded = set()
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True, env=env)
+        interpreter.append((time.perf_counter() - start) * 1000)
+
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE, json.dumps(COMMAND_ARGV[command]), json.dumps(HEAVY_MODULES)],
+            capture_output=True, text=True, check=True, env=env
+        )
+        result = json.loads(out.stdout.splitlines()[-1])
+        for phase, value in result["phases_ms"].items():
+            phases.setdefault(phase, []).append(value)
+        loaded.update(result["loaded_by_import"])
+
+    return {
+        "interpreter_ms": summarize(interpreter),
+        **{f"{phase}_ms": summarize(values) for phase, values in phases.items()},
+        "heavy_modules_loaded_by_import": sorted(loaded),
+    }
+
+
+def run(runs: int = 5, commands: list = None) -> dict:
+    with isolated_env() as env:
+        return {command: measure(command, runs, env) for command in commands or COMMAND_ARGV}
+
+
+def check(results: dict, budget_ms: float) -> list:
+    failures = []
+    for command, result in results.items():
+        if result["heavy_modules_loaded_by_import"]:
+            failures.append(f"{command}: importing the cli loaded {result['heavy_modules_loaded_by_import']}")
+        if result["import_ms"]["min"] > budget_ms:
+            failures.append(f"{command}: import took {result['import_ms']['min']:.1f}ms, budget {budget_ms}ms")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=150, help="fail if the fastest import is slower than this")
+    args = parser.parse_args(argv)
+
+    results = run(args.runs)
+    print(json.dumps(results, indent=2))
+
+    failures = check(results, args.budget_ms)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
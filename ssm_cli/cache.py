@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from ssm_cli.config import config
+from ssm_cli.filelock import FileLock
+from ssm_cli.xdg import get_cache_root
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class InventoryCache:
+    """
+    On disk cache of inventory lookups, one json file per key under the XDG cache dir.
+
+    Entries are written with an atomic rename so concurrent processes only ever see a whole file. Once an
+    entry is older than the ttl it is still served, while a single process (guarded by a lock file) refreshes it
+    in the background.
+    """
+    def __init__(self, session, refresh: bool = False):
+        self.root = get_cache_root() / 'inventory'
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.scope = [session.profile_name, session.region_name, config.group_tag_key]
+        self.refresh = refresh
+        self.ttl = config.cache.ttl
+        self.max_stale = config.cache.max_stale
+
+    def get(self, name: str, fetch: Callable[[], Any], max_stale: int = None) -> Any:
+        if max_stale is None:
+            max_stale = self.max_stale
+        path = self._path(name)
+        entry = None if self.refresh else self._read(path)
+
+        if entry is not None:
+            age = time.time() - entry['created']
+            if age < self.ttl:
+                logger.debug(f"cache hit {name} age={age:.1f}s")
+                return entry['value']
+            if age < max_stale:
+                logger.debug(f"cache stale {name} age={age:.1f}s, refreshing in background")
+                self._refresh_in_background(name, path, fetch)
+                return entry['value']
+
+        logger.debug(f"cache miss {name}")
+        value = fetch()
+        self._write(name, path, value)
+        return value
+
+    def _path(self, name: str) -> Path:
+        key = json.dumps(self.scope + [name])
+        return self.root / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+
+    def _read(self, path: Path) -> dict:
+        try:
+            with path.open('r') as file:
+                entry = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"ignoring unreadable cache {path}: {e}")
+            return None
+        if not isinstance(entry, dict) or 'created' not in entry or 'value' not in entry:
+            return None
+        return entry
+
+    def _write(self, name: str, path: Path, value: Any):
+        entry = {
+            'key': self.scope + [name],
+            'created': time.time(),
+            'value': value
+        }
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(entry, file)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"failed to write cache {path}: {e}")
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+
+    def _refresh_in_background(self, name: str, path: Path, fetch: Callable[[], Any]):
+        lock = FileLock(path.with_suffix('.lock'), stale=60)
+        if not lock.acquire(blocking=False):
+            logger.debug(f"cache {name} already being refreshed by another process")
+            return
+
+        # Not a daemon thread, short lived commands like list will wait for the refresh before exiting
+        def refresh():
+            try:
+                self._write(name, path, fetch())
+                logger.debug(f"cache {name} refreshed")
+            except Exception as e:
+                logger.warning(f"background refresh of {name} failed: {e}")
+            finally:
+                lock.release()
+
+        threading.Thread(target=refresh, name=f"cache-refresh-{name}").start()
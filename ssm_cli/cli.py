@@ -1,14 +1,11 @@
 import sys
+from typing import TYPE_CHECKING
 
-import boto3
-import botocore
-from rich_argparse import ArgumentDefaultsRichHelpFormatter
-
-from confclasses import load_config
-from ssm_cli.config import config
 from ssm_cli.xdg import get_log_file, get_conf_file
-from ssm_cli.commands import COMMANDS
-from ssm_cli.cli_args import CliArgumentParser
+from ssm_cli.commands import COMMANDS, DAEMON_COMMANDS
+
+if TYPE_CHECKING:
+    from ssm_cli.cli_args import CliArgumentParser
 
 import logging
 logging.basicConfig(
@@ -33,18 +30,11 @@ def cli(argv: list = None) -> int:
 
     logger.debug(f"CLI called with {argv}")
 
-    # Build the actual parser
-    parser = CliArgumentParser(
-        prog="ssm",
-        description="tool to manage AWS SSM",
-        formatter_class=ArgumentDefaultsRichHelpFormatter,
-    )
-    parser.add_global_argument("--profile", type=str, help="Which AWS profile to use")
-
-    for name, command in COMMANDS.items():
-        command_parser = parser.add_command_parser(name, command.HELP)
-        command.add_arguments(command_parser)
+    # config pulls in confclasses and yaml, importing this module should stay as cheap as possible
+    from confclasses import load_config
+    from ssm_cli.config import config
 
+    parser = build_parser(argv)
     args = parser.parse_args(argv)
 
     logger.debug(f"Arguments: {args}")
@@ -73,9 +63,23 @@ def cli(argv: list = None) -> int:
         logger.debug(f"setting logger {logger_name} to {level}")
         logging.getLogger(logger_name).setLevel(level.upper())
 
+    # The daemon makes its own sessions per request, it should not need a working default profile
+    if args.command == "daemon":
+        COMMANDS['daemon'].run(args, None)
+        return 0
+
+    if config.daemon.enabled and args.command in DAEMON_COMMANDS:
+        from ssm_cli.daemon import run_client
+        result = run_client(argv, args)
+        if result is not None:
+            return result
+
+    import boto3
+    import botocore.exceptions
+
     try:
         session = boto3.Session(profile_name=args.global_args.profile)
-        if session.region_name is None:
+        if session.region_name is None and not config.regions:
             eprint(f"AWS config missing region for profile {session.profile_name}")
             logger.error(f"AWS config missing region for profile {session.profile_name}")
             return 2
@@ -100,5 +104,29 @@ def cli(argv: list = None) -> int:
     
     return 0
 
+def build_parser(argv: list) -> "CliArgumentParser":
+    from ssm_cli.cli_args import CliArgumentParser
+
+    parser = CliArgumentParser(
+        prog="ssm",
+        description="tool to manage AWS SSM",
+        formatter_class=help_formatter,
+    )
+    parser.add_global_argument("--profile", type=str, help="Which AWS profile to use")
+    parser.add_global_argument("--no-cache", dest="cache_enabled", action="store_false", default=None, help="Do not use the inventory cache")
+    parser.add_global_argument("--refresh", action="store_true", help="Ignore cached inventory and fetch it again")
+
+    # Only the command being run gets imported to add its arguments, the rest just need their help text
+    for name in COMMANDS:
+        command_parser = parser.add_command_parser(name, COMMANDS.help(name))
+        if name in argv:
+            COMMANDS[name].add_arguments(command_parser)
+    return parser
+
+def help_formatter(*args, **kwargs):
+    """ rich is only imported once help or usage actually needs formatting """
+    from rich_argparse import ArgumentDefaultsRichHelpFormatter
+    return ArgumentDefaultsRichHelpFormatter(*args, **kwargs)
+
 def eprint(*args, **kwargs):
     print(file=sys.stderr, *args, **kwargs)
\ No newline at end of file
@@ -1,5 +1,6 @@
 import argparse
 import sys
+from typing import get_origin
 from confclasses import fields, is_confclass
 from ssm_cli.config import config
 
@@ -61,15 +62,39 @@ class CliArgumentParser(argparse.ArgumentParser):
     def add_config_args(self, config, prefix=""):
         for field in fields(config):
             if is_confclass(field.type):
-                self.add_config_args(field.type, f"{field.name}-")
+                self.add_config_args(field.type, f"{prefix}{field.name.replace('_','-')}-")
+            elif get_origin(field.type) is list:
+                self.global_args_parser.add_argument(f"--{prefix}{field.name.replace('_','-')}", type=comma_list, metavar="A,B,...", help=field.metadata.get('help', None))
+            elif field.type is bool:
+                self.global_args_parser.add_argument(f"--{prefix}{field.name.replace('_','-')}", action=argparse.BooleanOptionalAction, help=field.metadata.get('help', None))
             else:
                 self.global_args_parser.add_argument(f"--{prefix}{field.name.replace('_','-')}", type=field.type, help=field.metadata.get('help', None))
 
 
 
+def comma_list(value: str) -> list:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
 class CliNamespace(argparse.Namespace):
     def update_config(self):
         self._do_update_config(config, vars(self.global_args))
+
+    def config_overrides(self) -> list:
+        """ Dotted names of the config fields given on the command line """
+        return self._find_overrides(config, vars(self.global_args))
+
+    def _find_overrides(self, config, data: dict, path: str = "") -> list:
+        found = []
+        for field in fields(config):
+            name = field.name
+            if is_confclass(field.type):
+                prefix = f"{name}_"
+                nested = {k.replace(prefix, "", 1): v for k, v in data.items() if k.startswith(prefix)}
+                found += self._find_overrides(field.type, nested, f"{path}{name}.")
+            elif data.get(name) is not None:
+                found.append(f"{path}{name}")
+        return found
     
     def _do_update_config(self, config, data: dict):
         for field in fields(config):
@@ -80,8 +105,8 @@ class CliNamespace(argparse.Namespace):
                     raise RuntimeError("Config not loaded before injecting arg overrides")
 
                 prefix = f"{name}_"
-                data = {k.replace(prefix, ""): v for k, v in data.items() if k.startswith(prefix)}
-                self._do_update_config(getattr(config, name), data)
+                nested = {k.replace(prefix, "", 1): v for k, v in data.items() if k.startswith(prefix)}
+                self._do_update_config(getattr(config, name), nested)
             elif name in data and data[name] is not None:
                 setattr(config, name, data[name])
 
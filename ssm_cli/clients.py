@@ -0,0 +1,64 @@
+import threading
+import weakref
+from typing import TYPE_CHECKING, Dict
+
+from ssm_cli.config import config
+
+if TYPE_CHECKING:
+    import boto3
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ClientFactory:
+    """
+    Creates each boto3 client once per session and hands the same one back after that. Building a client
+    loads the service model and a client keeps its own connection pool, so reusing it saves both the setup
+    and the TLS handshakes. Clients are thread safe once created, creating them is not, hence the lock.
+    Factories are kept against their session weakly, so the session is passed in rather than held on to.
+    """
+    def __init__(self):
+        self.clients: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._botocore_config = None
+
+    def client(self, session: 'boto3.Session', name: str):
+        client = self.clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self.clients.get(name)
+            if client is None:
+                logger.debug(f"creating {name} client for profile={session.profile_name} region={session.region_name}")
+                client = session.client(name, config=self.botocore_config())
+                self.clients[name] = client
+            return client
+
+    def botocore_config(self):
+        if self._botocore_config is None:
+            from botocore.config import Config
+
+            self._botocore_config = Config(
+                max_pool_connections=config.aws.max_pool_connections,
+                tcp_keepalive=config.aws.tcp_keepalive,
+                retries={
+                    'mode': config.aws.retry_mode,
+                    'max_attempts': config.aws.max_attempts,
+                },
+                connect_timeout=config.aws.connect_timeout,
+                read_timeout=config.aws.read_timeout,
+            )
+        return self._botocore_config
+
+
+_factories: 'weakref.WeakKeyDictionary[boto3.Session, ClientFactory]' = weakref.WeakKeyDictionary()
+_factories_lock = threading.Lock()
+
+def get_client(session: 'boto3.Session', name: str):
+    """ The cached client for session, see ClientFactory """
+    with _factories_lock:
+        factory = _factories.get(session)
+        if factory is None:
+            factory = _factories[session] = ClientFactory()
+    return factory.client(session, name)
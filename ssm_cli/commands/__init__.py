@@ -1,14 +1,42 @@
-from typing import Dict
+from collections.abc import Mapping
+from importlib import import_module
+from typing import Dict, Iterator, Tuple, Type
 from ssm_cli.commands.base import BaseCommand
-from ssm_cli.commands.list import ListCommand
-from ssm_cli.commands.shell import ShellCommand
-from ssm_cli.commands.proxycommand import ProxyCommandCommand
-from ssm_cli.commands.setup import SetupCommand
-
-
-COMMANDS : Dict[str, BaseCommand] = {
-    'list': ListCommand,
-    'shell': ShellCommand,
-    'proxycommand': ProxyCommandCommand,
-    'setup': SetupCommand
-}
\ No newline at end of file
+
+
+class CommandRegistry(Mapping):
+    """
+    Maps command names to their classes, only importing a command's module when it is looked up.
+    The help text lives here so the full parser can be built without importing every command.
+    """
+    def __init__(self, commands: Dict[str, Tuple[str, str]]):
+        self._commands = commands
+        self._loaded: Dict[str, Type[BaseCommand]] = {}
+
+    def help(self, name: str) -> str:
+        return self._commands[name][1]
+
+    def __getitem__(self, name: str) -> Type[BaseCommand]:
+        if name not in self._loaded:
+            path, _ = self._commands[name]
+            module, cls = path.split(':')
+            self._loaded[name] = getattr(import_module(module), cls)
+        return self._loaded[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._commands)
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+
+COMMANDS = CommandRegistry({
+    'list': ('ssm_cli.commands.list:ListCommand', "List all instances in a group, if no group provided, will list all available groups"),
+    'shell': ('ssm_cli.commands.shell:ShellCommand', "Connects to instances"),
+    'proxycommand': ('ssm_cli.commands.proxycommand:ProxyCommandCommand', "SSH ProxyCommand feature"),
+    'setup': ('ssm_cli.commands.setup:SetupCommand', "Setups up ssm-cli"),
+    'daemon': ('ssm_cli.commands.daemon:DaemonCommand', "Runs the background broker proxycommand and list use when daemon.enabled is set"),
+})
+
+# Commands that are passed to the daemon when it is enabled
+DAEMON_COMMANDS = {'proxycommand', 'list'}
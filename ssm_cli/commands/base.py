@@ -1,15 +1,16 @@
 from abc import ABC, abstractmethod
 import argparse
+from typing import TYPE_CHECKING
 
-import boto3
+if TYPE_CHECKING:
+    import boto3
 
 class BaseCommand(ABC):
-    HELP: str = None
     CONFIG: type = None
     
     @abstractmethod
     def add_arguments(parser: argparse.ArgumentParser):
         pass
     @abstractmethod
-    def run(args: list, session: boto3.Session):
+    def run(args: list, session: 'boto3.Session'):
         pass
\ No newline at end of file
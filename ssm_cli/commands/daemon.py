@@ -0,0 +1,22 @@
+from ssm_cli.commands.base import BaseCommand
+
+import logging
+logger = logging.getLogger(__name__)
+
+class DaemonCommand(BaseCommand):
+    def add_arguments(parser):
+        parser.add_argument("--stop", action="store_true", help="stop the running daemon")
+
+    def run(args, session):
+        from ssm_cli.daemon import Daemon, stop_daemon
+
+        if args.stop:
+            if stop_daemon():
+                print("ssm daemon stopped")
+            else:
+                print("ssm daemon not running")
+            return
+
+        logger.info("running daemon action")
+        if not Daemon().serve():
+            print("ssm daemon already running")
@@ -1,22 +1,69 @@
-from ssm_cli.instances import Instances
+import csv
+import json
+import sys
+
+from ssm_cli.instances import Instance, get_instances
 from ssm_cli.commands.base import BaseCommand
 
 import logging
 logger = logging.getLogger(__name__)
 
 class ListCommand(BaseCommand):
-    HELP = """List all instances in a group, if no group provided, will list all available groups"""
     def add_arguments(parser):
         parser.add_argument("group", type=str, nargs="?", help="group to run against")
+        parser.add_argument("--output", "-o", choices=["table", "ndjson", "csv"], default="table", help="output format")
+        parser.add_argument("--stream", action="store_true", help="print rows as the pages arrive, unsorted and uncached")
     
     def run(args, session):
         logger.info("running list action")
 
-        instances = Instances(session)
+        instances = get_instances(session, args.global_args.refresh)
+        write_list(instances, args)
 
-        if args.group:
-            for instance in instances.list_instances(args.group):
-                print(instance)
+def write_list(instances, args, file=None):
+    if args.group:
+        if args.stream:
+            rows = instances.iter_instances(args.group)
+        else:
+            rows = instances.list_instances(args.group)
+        write_instances(rows, args.output, file, args.stream)
+    else:
+        if args.stream:
+            groups = instances.iter_groups()
         else:
-            for group in instances.list_groups():
-                print(group)
+            groups = instances.list_groups()
+        write_groups(groups, args.output, file, args.stream)
+
+def write_instances(instances, output: str, file=None, stream: bool = False):
+    if output == "table":
+        for instance in instances:
+            print(instance, file=file, flush=stream)
+        return
+    write_rows((instance.as_dict() for instance in instances), list(Instance.FIELDS), output, file, stream)
+
+def write_groups(groups, output: str, file=None, stream: bool = False):
+    if output == "table":
+        for group in groups:
+            print(group, file=file, flush=stream)
+        return
+    write_rows(({"group": group} for group in groups), ["group"], output, file, stream)
+
+def write_rows(rows, columns: list, output: str, file=None, stream: bool = False):
+    """
+    Writes each row as it comes, nothing is held onto so output can be piped while it is still being fetched.
+    With stream each row is flushed too, a pipe would otherwise only see them once the buffer fills.
+    """
+    if file is None:
+        file = sys.stdout
+    if output == "ndjson":
+        for row in rows:
+            file.write(json.dumps(row) + "\n")
+            if stream:
+                file.flush()
+    elif output == "csv":
+        writer = csv.DictWriter(file, columns, lineterminator="\n")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            if stream:
+                file.flush()
@@ -1,24 +1,29 @@
 import socket
 import time
+from typing import List, Tuple
 
-from ssm_cli.ssh.server import SshServer
-from ssm_cli.instances import Instances
+from ssm_cli.instances import get_instances
+from ssm_cli.portforward import PortForward, PortForwards
+from ssm_cli.ports import PortLeases
 from ssm_cli.config import config
+from ssm_cli.metrics import metrics
+from ssm_cli.selectors import CONNECTED, RELEASES
 from ssm_cli.commands.base import BaseCommand
 
 import logging
 logger = logging.getLogger(__name__)
 
 class ProxyCommandCommand(BaseCommand):
-    HELP="SSH ProxyCommand feature"
     def add_arguments(parser):
         parser.add_argument("group", type=str, help="group to run against")
 
     def run(args, session):
+        from ssm_cli.ssh.server import SshServer
+
         logger.info("running proxycommand action")
 
 
-        instances = Instances(session)
+        instances = get_instances(session, args.global_args.refresh)
         instance = instances.select_instance(args.group, config.actions.proxycommand.selector)
 
         if instance is None:
@@ -26,42 +31,128 @@ class ProxyCommandCommand(BaseCommand):
             raise RuntimeError("failed to select host")
 
         logger.info(f"connecting to {repr(instance)}")
-        
-        server = SshServer(direct_tcpip_callback(instance, session))
-        server.start()
+        start_metrics()
+
+        if config.actions.proxycommand.transport == "native":
+            server = SshServer(
+                native_tcpip_callback(instance, instances.session_for(instance)),
+                config.actions.proxycommand.forward_engine
+            )
+            try:
+                server.start()
+            finally:
+                release_instance(instance)
+                log_metrics_summary()
+            return
+
+        forwards = port_forwards(instances.session_for(instance))
+        # plugin startup takes seconds, overlap it with the SSH handshake
+        warm_forwards(instance, forwards)
+
+        server = SshServer(
+            direct_tcpip_callback(instance, forwards),
+            config.actions.proxycommand.forward_engine
+        )
+        try:
+            server.start()
+        finally:
+            forwards.close()
+            release_instance(instance)
+            log_metrics_summary()
+
+def release_instance(instance):
+    """ Lets go of anything the selector holds for the instance, once the connection through it is over """
+    release = RELEASES.get(config.actions.proxycommand.selector)
+    if release is not None:
+        release(instance)
 
-def direct_tcpip_callback(instance, session):
+def record_connection(instance, seconds: float = None):
+    """ Tells the selector how long a connection through the instance took to open, None when it failed """
+    connected = CONNECTED.get(config.actions.proxycommand.selector)
+    if connected is None:
+        return
+    try:
+        connected(instance, seconds)
+    except Exception as e:
+        logger.warning(f"failed to record connection to {instance.id}: {e}")
+
+def start_metrics():
+    if config.metrics.enabled:
+        metrics.start_reporting(config.metrics.interval)
+
+def log_metrics_summary():
+    if config.metrics.enabled:
+        metrics.log_summary()
+
+def direct_tcpip_callback(instance, forwards: PortForwards):
     def callback(host, remote_port) -> socket.socket:
         logger.debug(f"connect to {host}:{remote_port}")
-        internal_port = get_next_free_port(remote_port + 3000, 20)
-        logger.debug(f"got internal port {internal_port}")
         try:
-            instance.start_port_forwarding_session_to_remote_host(session, host, remote_port, internal_port)
+            return forwards.connect(instance, host, remote_port)
         except Exception as e:
             logger.error(f"failed to open port forward: {e}")
+            record_connection(instance, None)
             return None
-        
-        logger.debug(f"connecting to session manager plugin on 127.0.0.1:{internal_port}")
-        # Even though we wait for the process to say its connected, we STILL need to wait for it
-        for attempt in range(10):
-            try:
-                sock = socket.create_connection(('127.0.0.1', internal_port))
-                logger.info(f"connected to 127.0.0.1:{internal_port}")
-            except Exception as e:
-                logger.warning(f"connection attempt {attempt} failed: {e}")
-                time.sleep(0.1)
-        
-        return sock
 
     return callback
 
-def get_next_free_port(port: int, tries: int) -> int:
-    max_port = port + tries
-    while port < max_port:
-        logger.debug(f"attempting port {port}")
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.settimeout(1)
-        result = s.connect_ex(('127.0.0.1', port))
-        if result != 0:
-            return port
-        port += 1
\ No newline at end of file
+def native_tcpip_callback(instance, session):
+    """ Each channel gets its own SSM session, there is no plugin process or local port in between """
+    def callback(host, remote_port) -> socket.socket:
+        logger.debug(f"connect to {host}:{remote_port}")
+        started = time.monotonic()
+        try:
+            channel = instance.start_port_forwarding_data_channel(session, host, remote_port, config.actions.proxycommand.ready_timeout)
+        except Exception as e:
+            logger.error(f"failed to open data channel: {e}")
+            metrics.count("datachannel_failures")
+            record_connection(instance, None)
+            return None
+        opened = time.monotonic() - started
+        metrics.observe("datachannel_open", opened, instance.id)
+        record_connection(instance, opened)
+        return channel.socket()
+
+    return callback
+
+def port_forwards(session) -> PortForwards:
+    return PortForwards(
+        start_port_forward(session, config.actions.proxycommand.ready_timeout),
+        config.actions.proxycommand.session_idle_timeout,
+        config.actions.proxycommand.warm_idle_timeout
+    )
+
+def warm_forwards(instance, forwards: PortForwards):
+    warm = parse_destinations(config.actions.proxycommand.warm)
+    forwards.warm(instance, warm[:config.actions.proxycommand.warm_pool_size])
+
+def parse_destinations(destinations: List[str]) -> List[Tuple[str, int]]:
+    parsed = []
+    for destination in destinations:
+        host, _, port = destination.rpartition(":")
+        if not host or not port.isdigit():
+            logger.warning(f"ignoring warm destination {destination!r}, expected host:port")
+            continue
+        parsed.append((host, int(port)))
+    return parsed
+
+def start_port_forward(session, ready_timeout: int = 30):
+    # the lease only has to cover the plugin starting, after that it holds the port itself
+    leases = PortLeases(ttl=ready_timeout)
+
+    def start(instance, host, remote_port) -> PortForward:
+        started = time.monotonic()
+        internal_port = leases.allocate()
+        logger.debug(f"got internal port {internal_port}")
+        try:
+            proc = instance.start_port_forwarding_session_to_remote_host(session, host, remote_port, internal_port)
+        except Exception:
+            leases.release(internal_port)
+            raise
+        return PortForward(
+            instance, host, remote_port, internal_port, proc, ready_timeout, started,
+            on_close=lambda: leases.release(internal_port),
+            on_ready=lambda ready: record_connection(instance, ready)
+        )
+
+    return start
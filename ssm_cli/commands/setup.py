@@ -1,5 +1,4 @@
 import argparse
-import paramiko
 from ssm_cli.commands.base import BaseCommand
 from ssm_cli.xdg import get_conf_root, get_conf_file, get_log_file, get_ssh_hostkey
 
@@ -7,7 +6,6 @@ import logging
 logger = logging.getLogger(__name__)
 
 class SetupCommand(BaseCommand):
-    HELP = "Setups up ssm-cli"
     
     def add_arguments(parser):
         parser.add_argument("--replace", action=argparse.BooleanOptionalAction, default=False, help="if we should replace existing")
@@ -56,6 +54,8 @@ def create_conf_file(replace):
         path.unlink(True)
 
 def create_hostkey():
+    import paramiko
+
     path = get_ssh_hostkey(False)
     if path.exists():
         print(f"{path} - skipping (already exists)")
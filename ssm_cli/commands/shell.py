@@ -1,18 +1,13 @@
-from ssm_cli.instances import Instances
-from ssm_cli.config import config
+from ssm_cli.instances import get_instances
+from ssm_cli.config import config, ShellConfig
 from ssm_cli.commands.base import BaseCommand
-from dataclasses import dataclass
+from ssm_cli.selectors import RELEASES
 
 import logging
 logger = logging.getLogger(__name__)
 
-@dataclass
-class ShellConfig:
-    selector: str = "tui"
-
 class ShellCommand(BaseCommand):
     CONFIG = ShellConfig
-    HELP = "Connects to instances"
     
     def add_arguments(parser):
         parser.add_argument("group", type=str, help="group to run against")
@@ -20,8 +15,9 @@ class ShellCommand(BaseCommand):
     def run(args, session):
         logger.info("running shell action")
 
-        instances = Instances(session)
-        instance = instances.select_instance(args.group, "tui")
+        instances = get_instances(session, args.global_args.refresh)
+        selector = config.actions.shell.selector
+        instance = instances.select_instance(args.group, selector)
 
         if instance is None:
             logger.error("failed to select host")
@@ -29,4 +25,9 @@ class ShellCommand(BaseCommand):
 
         logger.info(f"connecting to {repr(instance)}")
         
-        instance.start_session(session)
\ No newline at end of file
+        try:
+            instance.start_session(instances.session_for(instance))
+        finally:
+            release = RELEASES.get(selector)
+            if release is not None:
+                release(instance)
@@ -1,15 +1,52 @@
-from typing import Dict
+from typing import Dict, List
 from confclasses import confclass
 
 
 @confclass
 class ProxyCommandConfig:
     selector: str = "first"
+    forward_engine: str = "asyncio"
+    """How forwarded channels are served, asyncio runs them all on one event loop, thread is one thread per channel"""
+    transport: str = "plugin"
+    """How channels reach the instance, plugin runs session-manager-plugin, native speaks the SSM data channel in process (no KMS encrypted sessions)"""
+    session_idle_timeout: int = 300
+    """Seconds an unused port forwarding session is kept around for new channels to the same destination"""
+    ready_timeout: int = 30
+    """Seconds a new port forwarding session has to start accepting connections"""
+    warm: List[str] = []
+    """host:port destinations to start forwarding to on the selected instance while the SSH handshake runs, e.g. localhost:22"""
+    warm_pool_size: int = 4
+    """Most destinations from warm that are started ahead of time"""
+    warm_idle_timeout: int = 60
+    """Seconds a warmed session waits for its first channel before it is stopped"""
+
+@confclass
+class ShellConfig:
+    selector: str = "tui"
+    """Which selector picks the instance to start a shell on, search or tui ask in the terminal"""
 
 @confclass
 class ActionsConfig:
     proxycommand: ProxyCommandConfig
+    shell: ShellConfig
     
+@confclass
+class FastestConfig:
+    ttl: int = 300
+    """Seconds a measured connection time is used before the instance is tried again"""
+    retry_failed: int = 60
+    """Seconds an instance whose connection failed is passed over"""
+
+@confclass
+class SpreadConfig:
+    ttl: int = 3600
+    """Seconds a connection counts against its instance at most, it normally stops counting when its proxycommand exits"""
+
+@confclass
+class SelectorsConfig:
+    fastest: FastestConfig
+    spread: SpreadConfig
+
 @confclass
 class LoggingConfig:
     level: str = "info"
@@ -18,11 +55,68 @@ class LoggingConfig:
     }
     """key value dictionary to override log level on, some modules make a lot of noise, botocore for example"""
 
+@confclass
+class CacheConfig:
+    enabled: bool = True
+    """If inventory lookups should be cached on disk between runs"""
+    ttl: int = 300
+    """Seconds a cached inventory is served without asking AWS again"""
+    max_stale: int = 86400
+    """Seconds an expired inventory is still served while it is refreshed in the background"""
+    select_max_stale: int = 900
+    """The same as max_stale when picking an instance to connect to, past it the inventory is fetched before connecting"""
+
+@confclass
+class FanoutConfig:
+    max_workers: int = 8
+    """How many profile/region targets are queried at the same time"""
+    timeout: int = 20
+    """Seconds each profile/region target has to answer before it is left out"""
+
+@confclass
+class AwsConfig:
+    max_pool_connections: int = 10
+    """HTTP connections kept open per client, proxycommand can start sessions from several channels at once"""
+    tcp_keepalive: bool = True
+    """Keep idle API connections alive so later calls skip the TLS handshake"""
+    retry_mode: str = "adaptive"
+    """botocore retry mode, legacy, standard or adaptive"""
+    max_attempts: int = 5
+    """Attempts per API call including the first"""
+    connect_timeout: int = 5
+    """Seconds to wait for an API connection"""
+    read_timeout: int = 30
+    """Seconds to wait for an API response"""
+
+@confclass
+class DaemonConfig:
+    enabled: bool = False
+    """If proxycommand and list should go through a background `ssm daemon`, it is started on first use"""
+    idle_timeout: int = 900
+    """Seconds the daemon stays up without any connections before it exits"""
+
+@confclass
+class MetricsConfig:
+    enabled: bool = True
+    """If proxycommand should log channel traffic and latency metrics as json lines"""
+    interval: int = 60
+    """Seconds between metrics lines while channels are active, a summary is always logged on exit"""
+
 @confclass
 class Config:
     log: LoggingConfig
     actions: ActionsConfig
+    selectors: SelectorsConfig
+    cache: CacheConfig
+    fanout: FanoutConfig
+    aws: AwsConfig
+    daemon: DaemonConfig
+    metrics: MetricsConfig
     group_tag_key: str = "group"
     """Tag key to use when filtering, this is usually set during ssm setup."""
+    profiles: List[str] = []
+    """AWS profiles to query together, empty uses just the --profile/environment one"""
+    regions: List[str] = []
+    """AWS regions to query together, empty uses the region of each profile"""
     
 config = Config()
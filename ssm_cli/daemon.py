@@ -0,0 +1,518 @@
+import io
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from ssm_cli.config import config
+from ssm_cli.filelock import FileLock
+from ssm_cli.metrics import metrics
+from ssm_cli.xdg import get_runtime_root
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Bumped whenever requests or replies change, a client talking to an older daemon is told to restart it
+PROTOCOL = 3
+# The client environment that decides which AWS profile and region a request runs against, the daemon runs without
+# them so a request never picks up the ones of whichever shell started it
+FORWARDED_ENV = ('AWS_PROFILE', 'AWS_REGION', 'AWS_DEFAULT_REGION')
+# Sent for the profile or region when the client has none set, the daemon then leaves it to the AWS config
+DEFAULT = 'default'
+# Credentials given through the environment (aws-vault, SSO exports and the like) belong to that one shell, the
+# daemon would go on using whichever ones it was started with, so these commands run in process instead
+CREDENTIAL_ENV = (
+    'AWS_ACCESS_KEY_ID',
+    'AWS_SECRET_ACCESS_KEY',
+    'AWS_SESSION_TOKEN',
+    'AWS_SECURITY_TOKEN',
+    'AWS_WEB_IDENTITY_TOKEN_FILE',
+    'AWS_ROLE_ARN',
+    'AWS_CONTAINER_CREDENTIALS_RELATIVE_URI',
+    'AWS_CONTAINER_CREDENTIALS_FULL_URI',
+)
+SPAWN_TIMEOUT = 10
+# list output follows the reply in frames with this length prefix, an empty frame marks the end
+FRAME = struct.Struct('>I')
+# how long to wait after the daemon ends an ssh stream for ssh to close stdin, if it does not the daemon failed
+STDIN_GRACE = 1
+
+
+class DaemonError(Exception):
+    """ Failure reported back to the client, code is the exit code it should use """
+    def __init__(self, message: str, code: int = 5):
+        super().__init__(message)
+        self.code = code
+
+
+def get_socket_path() -> Path:
+    return get_runtime_root() / 'daemon.sock'
+
+
+# Client side, this runs in every ssh invocation so keep it to the standard library
+
+def run_client(argv: list, args) -> Optional[int]:
+    """ Runs the command through the daemon, None when the daemon cannot be used and it should run in process """
+    from ssm_cli.selectors import INTERACTIVE
+
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    if args.command == 'proxycommand' and config.actions.proxycommand.selector in INTERACTIVE:
+        logger.debug("interactive selector needs a terminal, not using the daemon")
+        return None
+    credentials = [key for key in CREDENTIAL_ENV if os.environ.get(key)]
+    if credentials:
+        logger.debug(f"AWS credentials set in the environment ({', '.join(credentials)}), not using the daemon")
+        return None
+    # the daemon's config is shared by every request, overrides only apply to a run in process
+    overrides = args.config_overrides()
+    if overrides:
+        logger.debug(f"config overridden on the command line ({', '.join(overrides)}), not using the daemon")
+        return None
+
+    try:
+        sock = connect()
+    except OSError as e:
+        logger.warning(f"daemon unavailable, running in process: {e}")
+        return None
+
+    with sock:
+        send_message(sock, {'version': PROTOCOL, 'action': 'run', 'argv': argv, **client_session(args)})
+        reply = read_message(sock)
+        if reply is None:
+            print("ssm daemon closed the connection", file=sys.stderr)
+            return 5
+        if not reply['ok']:
+            print(reply['error'], file=sys.stderr)
+            return reply.get('code', 5)
+        if args.command == 'proxycommand':
+            finished = pipe_stdio(sock)
+        else:
+            finished = read_frames(sock)
+        if not finished:
+            # whatever went wrong is in the daemon's log, it cannot be replied with once output has started
+            print("ssm daemon closed the connection part way through", file=sys.stderr)
+            return 5
+    return 0
+
+def client_session(args) -> dict:
+    """ The profile and region this command would run against in process """
+    profile = args.global_args.profile or os.environ.get('AWS_PROFILE') or DEFAULT
+    region = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION') or DEFAULT
+    return {'profile': profile, 'region': region}
+
+def stop_daemon() -> bool:
+    try:
+        sock = connect(spawn=False)
+    except OSError:
+        return False
+    with sock:
+        send_message(sock, {'version': PROTOCOL, 'action': 'stop'})
+        read_message(sock)
+    return True
+
+def connect(spawn: bool = True) -> socket.socket:
+    path = get_socket_path()
+    try:
+        return _connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        if not spawn:
+            raise
+
+    logger.info("starting ssm daemon")
+    subprocess.Popen(
+        [sys.executable, '-m', 'ssm_cli', 'daemon'],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        env={key: value for key, value in os.environ.items() if key not in FORWARDED_ENV},
+    )
+
+    deadline = time.monotonic() + SPAWN_TIMEOUT
+    delay = 0.01
+    while True:
+        try:
+            return _connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"ssm daemon did not start listening on {path}")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+def _connect(path: Path) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+def pipe_stdio(sock: socket.socket) -> bool:
+    """
+    Copies stdin to the daemon and its replies to stdout until it closes. True when ssh closed stdin first,
+    a stream the daemon ended while ssh was still using it means the connection failed on the daemon side.
+    """
+    stdin_closed = threading.Event()
+    threading.Thread(target=_copy_stdin, args=(sock, stdin_closed), name="stdin-reader", daemon=True).start()
+
+    stdout = sys.stdout.fileno()
+    sys.stdout.flush()
+    while True:
+        data = sock.recv(64 * 1024)
+        if not data:
+            return stdin_closed.wait(STDIN_GRACE)
+        _write_all(stdout, data)
+
+def read_frames(sock: socket.socket) -> bool:
+    """ Writes the framed output to stdout, False if the daemon closed the connection before the end frame """
+    stdout = sys.stdout.fileno()
+    sys.stdout.flush()
+    while True:
+        header = _recv_exactly(sock, FRAME.size)
+        if header is None:
+            return False
+        length, = FRAME.unpack(header)
+        if length == 0:
+            return True
+        data = _recv_exactly(sock, length)
+        if data is None:
+            return False
+        _write_all(stdout, data)
+
+def _recv_exactly(sock: socket.socket, length: int) -> Optional[bytes]:
+    data = bytearray()
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def _copy_stdin(sock: socket.socket, closed: threading.Event):
+    stdin = sys.stdin.fileno()
+    try:
+        while True:
+            data = os.read(stdin, 64 * 1024)
+            if not data:
+                break
+            sock.sendall(data)
+        closed.set()
+        sock.shutdown(socket.SHUT_WR)
+    except OSError as e:
+        logger.debug(f"stopped copying stdin: {e}")
+
+def send_message(sock: socket.socket, message: dict):
+    sock.sendall(json.dumps(message).encode() + b'\n')
+
+def read_message(sock: socket.socket) -> Optional[dict]:
+    """ One json line, read a byte at a time so nothing after it is taken off the socket """
+    line = bytearray()
+    while True:
+        byte = sock.recv(1)
+        if not byte:
+            return None
+        if byte == b'\n':
+            return json.loads(line)
+        line += byte
+
+
+class FrameWriter(io.RawIOBase):
+    """ Sends each write as one length prefixed frame, end() sends the empty frame that says the output is complete """
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if data:
+            self.sock.sendall(FRAME.pack(len(data)) + bytes(data))
+        return len(data)
+
+    def end(self):
+        self.sock.sendall(FRAME.pack(0))
+
+
+class Reply:
+    """
+    The reply line for one request. Once ok has been sent the connection carries the command's output, an error
+    after that cannot go back as a reply without ending up in the output, so the connection is only closed.
+    """
+    def __init__(self, conn: socket.socket):
+        self.conn = conn
+        self.sent = False
+
+    def ok(self):
+        send_message(self.conn, {'ok': True})
+        self.sent = True
+
+    def error(self, error: str, code: int):
+        if self.sent:
+            logger.error(f"failed after replying, closing the connection: {error}")
+            return
+        try:
+            send_message(self.conn, {'ok': False, 'error': error, 'code': code})
+        except OSError:
+            pass
+
+
+# Daemon side
+
+class Daemon:
+    """
+    Long lived process behind `ssm proxycommand` and `ssm list` when daemon.enabled is set. It keeps boto3
+    sessions and clients, inventory and running port forwards between invocations, so a repeat ssh connection
+    skips all of that setup and only pays for starting a thin client.
+
+    Listens on a unix socket in the XDG runtime dir, which only the user can reach. Each connection sends one
+    json request line and gets a json reply line, for proxycommand the connection then carries the SSH stream.
+    Exits after idle_timeout seconds without any connections.
+    """
+    def __init__(self, path: Path = None, idle_timeout: int = None):
+        self.path = get_socket_path() if path is None else Path(path)
+        self.idle_timeout = config.daemon.idle_timeout if idle_timeout is None else idle_timeout
+        self.active = 0
+        self.last_used = time.monotonic()
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._sessions: Dict[Tuple[str, str], object] = {}
+        self._instances: Dict[object, object] = {}
+        self._forwards: Dict[object, object] = {}
+        self._host_key = None
+
+    def serve(self) -> bool:
+        """ Serves until stopped or idle, False if another daemon is already running """
+        listener = self._listen()
+        if listener is None:
+            return False
+
+        logger.info(f"ssm daemon listening on {self.path}")
+        # clients spawn it without these, but it can also be started by hand
+        for key in FORWARDED_ENV:
+            os.environ.pop(key, None)
+        if config.metrics.enabled:
+            metrics.start_reporting(config.metrics.interval)
+        threading.Thread(target=self._stop_when_idle, name="daemon-idle", daemon=True).start()
+        try:
+            with listener:
+                # accept does not wake up when the listener is closed from another thread, so poll for stopping
+                listener.settimeout(1)
+                while not self.stopped.is_set():
+                    try:
+                        conn, _ = listener.accept()
+                    except socket.timeout:
+                        continue
+                    conn.settimeout(None)
+                    with self._lock:
+                        self.active += 1
+                    threading.Thread(target=self._handle, args=(conn,), name="daemon-conn", daemon=True).start()
+        finally:
+            self._close()
+        return True
+
+    def stop(self):
+        self.stopped.set()
+
+    def _listen(self) -> Optional[socket.socket]:
+        # two clients can spawn a daemon at the same time, only one of them gets to bind
+        with FileLock(self.path.with_suffix('.lock'), stale=10):
+            try:
+                _connect(self.path).close()
+                logger.info(f"ssm daemon already running on {self.path}")
+                return None
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass
+
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            umask = os.umask(0o177)
+            try:
+                listener.bind(str(self.path))
+            finally:
+                os.umask(umask)
+            os.chmod(self.path, 0o600)
+            listener.listen(64)
+            return listener
+
+    def _stop_when_idle(self):
+        while not self.stopped.wait(min(10, self.idle_timeout)):
+            with self._lock:
+                idle = self.active == 0 and time.monotonic() - self.last_used >= self.idle_timeout
+            if idle:
+                logger.info(f"ssm daemon idle for {self.idle_timeout}s, stopping")
+                self.stop()
+
+    def _close(self):
+        with self._lock:
+            forwards, self._forwards = list(self._forwards.values()), {}
+        for forward in forwards:
+            forward.close()
+        if config.metrics.enabled:
+            metrics.log_summary()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+        logger.info("ssm daemon stopped")
+
+    def _handle(self, conn: socket.socket):
+        reply = Reply(conn)
+        try:
+            if not same_user(conn):
+                raise DaemonError("connection from another user refused")
+            request = read_message(conn)
+            if request is None:
+                return
+            if request.get('version') != PROTOCOL:
+                raise DaemonError("ssm daemon is a different version, stop it with `ssm daemon --stop`")
+            if request['action'] == 'stop':
+                reply.ok()
+                self.stop()
+                return
+            self._run(conn, reply, request['argv'], request['profile'], request['region'])
+        except DaemonError as e:
+            logger.error(f"request failed: {e}")
+            reply.error(str(e), e.code)
+        except Exception as e:
+            logger.exception(f"request failed: {e}")
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ExpiredTokenException':
+                reply.error("AWS credentials expired", 2)
+            else:
+                reply.error(str(e), 5)
+        finally:
+            conn.close()
+            with self._lock:
+                self.active -= 1
+                self.last_used = time.monotonic()
+
+    def _run(self, conn: socket.socket, reply: Reply, argv: list, profile: str, region: str):
+        from ssm_cli.cli import build_parser
+
+        args = build_parser(argv).parse_args(argv)
+        logger.info(f"daemon running {args.command} for {argv}")
+        session = self.session(profile, region)
+
+        if args.command == 'proxycommand':
+            self._proxycommand(conn, reply, args, session)
+        elif args.command == 'list':
+            self._list(conn, reply, args, session)
+        else:
+            raise DaemonError(f"ssm daemon does not run {args.command}", 3)
+
+    def _proxycommand(self, conn: socket.socket, reply: Reply, args, session):
+        from ssm_cli.commands.proxycommand import direct_tcpip_callback, native_tcpip_callback, release_instance, warm_forwards
+        from ssm_cli.ssh.server import SshServer
+
+        instances = self.instances(session, args.global_args.refresh)
+        instance = instances.select_instance(args.group, config.actions.proxycommand.selector)
+        if instance is None:
+            raise DaemonError("failed to select host")
+        logger.info(f"connecting to {repr(instance)}")
+
+        if config.actions.proxycommand.transport == "native":
+            callback = native_tcpip_callback(instance, instances.session_for(instance))
+        else:
+            forwards = self.forwards(instances.session_for(instance))
+            warm_forwards(instance, forwards)
+            callback = direct_tcpip_callback(instance, forwards)
+
+        # everything that can fail with a reply happens first, after ok the connection is the ssh stream
+        server = SshServer(callback, config.actions.proxycommand.forward_engine, self.host_key())
+        reply.ok()
+        try:
+            server.start(conn)
+        finally:
+            # every connection shares the daemon's pid, so its assignment would otherwise last until the daemon exits
+            release_instance(instance)
+
+    def _list(self, conn: socket.socket, reply: Reply, args, session):
+        from ssm_cli.commands.list import write_list
+
+        instances = self.instances(session, args.global_args.refresh)
+        frames = FrameWriter(conn)
+        file = io.TextIOWrapper(io.BufferedWriter(frames), encoding='utf-8', newline='')
+        if args.stream:
+            reply.ok()
+            write_list(instances, args, file)
+        else:
+            # fetch everything first so an error can still be replied with
+            buffer = io.StringIO()
+            write_list(instances, args, buffer)
+            reply.ok()
+            file.write(buffer.getvalue())
+        file.flush()
+        # only a complete listing gets the end frame, the client fails one that stops short
+        frames.end()
+
+    def session(self, profile: str, region: str):
+        import boto3
+
+        with self._lock:
+            session = self._sessions.get((profile, region))
+            if session is None:
+                try:
+                    session = boto3.Session(
+                        profile_name=None if profile == DEFAULT else profile,
+                        region_name=None if region == DEFAULT else region,
+                    )
+                except Exception as e:
+                    raise DaemonError(f"AWS profile invalid: {e}", 2)
+                if session.region_name is None and not config.regions:
+                    raise DaemonError(f"AWS config missing region for profile {session.profile_name}", 2)
+                self._sessions[(profile, region)] = session
+            return session
+
+    def instances(self, session, refresh: bool):
+        from ssm_cli.instances import get_instances
+
+        # a refresh gets its own inventory, otherwise every later request would refetch too
+        if refresh:
+            return get_instances(session, True)
+        with self._lock:
+            instances = self._instances.get(session)
+            if instances is None:
+                instances = self._instances[session] = get_instances(session)
+            return instances
+
+    def forwards(self, session):
+        from ssm_cli.commands.proxycommand import port_forwards
+
+        with self._lock:
+            forwards = self._forwards.get(session)
+            if forwards is None:
+                forwards = self._forwards[session] = port_forwards(session)
+            return forwards
+
+    def host_key(self):
+        from ssm_cli.ssh.server import load_host_key
+
+        with self._lock:
+            if self._host_key is None:
+                self._host_key = load_host_key()
+            return self._host_key
+
+
+def same_user(conn: socket.socket) -> bool:
+    """ The socket file is already 0600 in a 0700 dir, where the platform can say who connected check that too """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return True
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid == os.getuid()
@@ -0,0 +1,260 @@
+import json
+import socket
+import struct
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List
+
+from ssm_cli.datachannel import message as msg
+from ssm_cli.datachannel.message import ClientMessage
+from ssm_cli.datachannel.websocket import OP_BINARY, OP_TEXT, WebSocket, WebSocketClosed, connect
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Agents only multiplex a port session (smux) for clients from 1.1.70, below that it is one plain stream
+CLIENT_VERSION = "1.1.61.0"
+# Same payload size session-manager-plugin sends, the agent is known to be happy with it
+STREAM_CHUNK = 1024
+# Unacknowledged messages are sent again after this long
+RESEND_TIMEOUT = 0.5
+RESEND_INTERVAL = 0.1
+# Stop reading the local socket once this many messages are waiting for an ack
+MAX_UNACKED = 2000
+
+ACTION_SUCCESS = 1
+ACTION_FAILED = 2
+ACTION_UNSUPPORTED = 3
+
+
+class DataChannel:
+    """
+    The SSM session data channel spoken in process, instead of through session-manager-plugin and a localhost port.
+
+    The websocket carries ClientMessages. Output from the agent is acknowledged and put back in sequence
+    order, input to the agent is numbered and kept until the agent acknowledges it, anything unacknowledged
+    after RESEND_TIMEOUT is sent again. Only plain port sessions are supported, KMS encrypted sessions need the plugin.
+
+    socket() gives the other end of a socketpair, so the forward engines treat it like any other connection.
+    """
+    def __init__(self, stream_url: str, token: str, session_id: str = None, on_close: Callable[[], None] = None):
+        self.stream_url = stream_url
+        self.token = token
+        self.session_id = session_id
+        self.on_close = on_close
+        self.ws: WebSocket = None
+        self.error: str = None
+
+        self._local, self._remote = socket.socketpair()
+        self._ready = threading.Event()
+        self._closed = threading.Event()
+        self._send_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._next_sequence = 0
+        self._unacked: Dict[int, List] = {}
+        self._expected = 0
+        self._out_of_order: Dict[int, ClientMessage] = {}
+        self._publishing = threading.Event()
+        self._publishing.set()
+
+    def __repr__(self):
+        return f"DataChannel({self.session_id})"
+
+    def open(self, timeout: float = 30) -> 'DataChannel':
+        """ Connects and waits for the handshake, raises if the channel is not usable within timeout """
+        deadline = time.monotonic() + timeout
+        self.ws = connect(self.stream_url, timeout)
+        self.ws.send(json.dumps({
+            "MessageSchemaVersion": "1.0",
+            "RequestId": str(uuid.uuid4()),
+            "TokenValue": self.token,
+            "ClientId": str(uuid.uuid4()),
+            "ClientVersion": CLIENT_VERSION,
+        }).encode(), OP_TEXT)
+
+        threading.Thread(target=self._read_loop, name=f"datachannel-{self.session_id}", daemon=True).start()
+        threading.Thread(target=self._resend_loop, name=f"datachannel-resend-{self.session_id}", daemon=True).start()
+
+        if not self._ready.wait(max(0, deadline - time.monotonic())):
+            self.close()
+            raise TimeoutError(f"{self!r} handshake not complete after {timeout}s")
+        if self.error is not None:
+            self.close()
+            raise ConnectionError(f"{self!r} {self.error}")
+
+        threading.Thread(target=self._read_local, name=f"datachannel-local-{self.session_id}", daemon=True).start()
+        logger.info(f"{self!r} open")
+        return self
+
+    def socket(self) -> socket.socket:
+        return self._remote
+
+    def send_input(self, payload: bytes, payload_type: int = msg.OUTPUT):
+        # the lock keeps sequence numbers in wire order, acks only need the condition so are never held up by it
+        with self._send_lock:
+            with self._cond:
+                while len(self._unacked) >= MAX_UNACKED and not self._closed.is_set():
+                    self._cond.wait()
+                if self._closed.is_set():
+                    raise ConnectionError(f"{self!r} closed")
+                sequence = self._next_sequence
+                self._next_sequence += 1
+                data = ClientMessage(msg.INPUT_STREAM_DATA, sequence, payload, payload_type).serialize()
+                self._unacked[sequence] = [data, time.monotonic()]
+            self._publishing.wait()
+            self.ws.send(data)
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        logger.info(f"closing {self!r}")
+        with self._cond:
+            self._cond.notify_all()
+        self._publishing.set()
+        if self.ws is not None:
+            self.ws.close()
+        try:
+            self._local.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._local.close()
+        if self.on_close is not None:
+            self.on_close()
+
+    def _read_loop(self):
+        try:
+            while not self._closed.is_set():
+                opcode, data = self.ws.recv()
+                if opcode != OP_BINARY:
+                    logger.debug(f"{self!r} ignoring text message {data[:200]!r}")
+                    continue
+                if not self._handle(ClientMessage.deserialize(data)):
+                    break
+        except (WebSocketClosed, OSError) as e:
+            logger.info(f"{self!r} websocket ended: {e}")
+        except ValueError as e:
+            logger.error(f"{self!r} bad message: {e}")
+        finally:
+            # nothing more is coming, wake open() if it is still waiting
+            if not self._ready.is_set():
+                self.error = self.error or "closed before the handshake completed"
+                self._ready.set()
+            self.close()
+
+    def _handle(self, message: ClientMessage) -> bool:
+        """ Returns False once the channel is finished """
+        if message.message_type == msg.OUTPUT_STREAM_DATA:
+            self._acknowledge(message)
+            if message.sequence_number < self._expected:
+                logger.debug(f"{self!r} duplicate message {message.sequence_number}")
+                return True
+            self._out_of_order[message.sequence_number] = message
+            while self._expected in self._out_of_order:
+                self._deliver(self._out_of_order.pop(self._expected))
+                self._expected += 1
+        elif message.message_type == msg.ACKNOWLEDGE:
+            acknowledged = json.loads(message.payload)["AcknowledgedMessageSequenceNumber"]
+            with self._cond:
+                self._unacked.pop(acknowledged, None)
+                self._cond.notify_all()
+        elif message.message_type == msg.CHANNEL_CLOSED:
+            closed = json.loads(message.payload) if message.payload else {}
+            logger.info(f"{self!r} closed by agent: {closed.get('Output', '')}")
+            return False
+        elif message.message_type == msg.PAUSE_PUBLICATION:
+            self._publishing.clear()
+        elif message.message_type == msg.START_PUBLICATION:
+            self._publishing.set()
+        else:
+            logger.debug(f"{self!r} ignoring {message.message_type}")
+        return True
+
+    def _deliver(self, message: ClientMessage):
+        if message.payload_type == msg.OUTPUT:
+            # agents from before the handshake existed go straight to output
+            self._ready.set()
+            self._local.sendall(message.payload)
+        elif message.payload_type == msg.HANDSHAKE_REQUEST:
+            self._handshake(json.loads(message.payload))
+        elif message.payload_type == msg.HANDSHAKE_COMPLETE:
+            logger.debug(f"{self!r} handshake complete: {message.payload[:200]!r}")
+            self._ready.set()
+        elif message.payload_type == msg.ENC_CHALLENGE_REQUEST:
+            self.error = "KMS encrypted sessions need session-manager-plugin"
+            self._ready.set()
+        else:
+            logger.debug(f"{self!r} ignoring payload type {message.payload_type}: {message.payload[:200]!r}")
+
+    def _handshake(self, request: dict):
+        processed = []
+        for action in request.get("RequestedClientActions", []):
+            kind = action.get("ActionType")
+            if kind == "SessionType":
+                session_type = action.get("ActionParameters", {}).get("SessionType")
+                if session_type == "Port":
+                    processed.append({"ActionType": kind, "ActionStatus": ACTION_SUCCESS})
+                else:
+                    self.error = f"{session_type} sessions are not supported"
+                    processed.append({"ActionType": kind, "ActionStatus": ACTION_FAILED, "Error": self.error})
+            elif kind == "KMSEncryption":
+                self.error = "KMS encrypted sessions need session-manager-plugin"
+                processed.append({"ActionType": kind, "ActionStatus": ACTION_FAILED, "Error": self.error})
+            else:
+                processed.append({"ActionType": kind, "ActionStatus": ACTION_UNSUPPORTED})
+
+        response = {"ClientVersion": CLIENT_VERSION, "ProcessedClientActions": processed, "Errors": []}
+        self.send_input(json.dumps(response).encode(), msg.HANDSHAKE_RESPONSE)
+        if self.error is not None:
+            self._ready.set()
+
+    def _acknowledge(self, message: ClientMessage):
+        payload = json.dumps({
+            "AcknowledgedMessageType": message.message_type,
+            "AcknowledgedMessageId": str(message.message_id),
+            "AcknowledgedMessageSequenceNumber": message.sequence_number,
+            "IsSequentialMessage": True,
+        }).encode()
+        self.ws.send(ClientMessage(msg.ACKNOWLEDGE, 0, payload, payload_type=0, flags=msg.FLAG_ACK).serialize())
+
+    def _resend_loop(self):
+        while not self._closed.wait(RESEND_INTERVAL):
+            now = time.monotonic()
+            with self._cond:
+                due = [entry for entry in self._unacked.values() if now - entry[1] >= RESEND_TIMEOUT]
+                for entry in due:
+                    entry[1] = now
+            for data, _ in due:
+                try:
+                    self.ws.send(data)
+                except OSError:
+                    return
+            if due:
+                logger.debug(f"{self!r} resent {len(due)} messages")
+
+    def _read_local(self):
+        try:
+            while True:
+                data = self._local.recv(STREAM_CHUNK)
+                if not data:
+                    break
+                self.send_input(data)
+            logger.debug(f"{self!r} local EOF, disconnecting")
+            self.send_input(struct.pack('!I', msg.DISCONNECT_TO_PORT), msg.FLAG)
+            self._drain()
+        except (ConnectionError, OSError) as e:
+            logger.debug(f"{self!r} stopped reading local socket: {e}")
+        finally:
+            self.close()
+
+    def _drain(self, timeout: float = 5):
+        """ Gives the agent a chance to acknowledge everything before the websocket goes """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._unacked and not self._closed.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"{self!r} closing with {len(self._unacked)} unacknowledged messages")
+                    return
+                self._cond.wait(remaining)
@@ -0,0 +1,105 @@
+import hashlib
+import struct
+import time
+import uuid
+from dataclasses import dataclass, field
+
+# Message types, sent space padded to 32 bytes
+INPUT_STREAM_DATA = "input_stream_data"
+OUTPUT_STREAM_DATA = "output_stream_data"
+ACKNOWLEDGE = "acknowledge"
+CHANNEL_CLOSED = "channel_closed"
+START_PUBLICATION = "start_publication"
+PAUSE_PUBLICATION = "pause_publication"
+
+# Payload types
+OUTPUT = 1
+ERROR = 2
+SIZE = 3
+PARAMETER = 4
+HANDSHAKE_REQUEST = 5
+HANDSHAKE_RESPONSE = 6
+HANDSHAKE_COMPLETE = 7
+ENC_CHALLENGE_REQUEST = 8
+ENC_CHALLENGE_RESPONSE = 9
+FLAG = 10
+STDERR = 11
+EXIT_CODE = 12
+
+# Flag payloads for port sessions, a big endian uint32
+DISCONNECT_TO_PORT = 1
+TERMINATE_SHOWING_ERROR = 2
+CONNECT_TO_PORT_ERROR = 3
+
+# Message flags
+FLAG_DATA = 0
+FLAG_SYN = 1
+FLAG_FIN = 2
+FLAG_ACK = 3
+
+# Header layout, the HeaderLength field holds the offset of PayloadLength, the payload follows it
+HEADER = struct.Struct('!I32sIQqQ16s32sII')
+HEADER_LENGTH = HEADER.size - 4
+
+
+@dataclass
+class ClientMessage:
+    """ The binary frame both ends of the data channel exchange, see AgentMessage in the amazon-ssm-agent source """
+    message_type: str
+    sequence_number: int
+    payload: bytes
+    payload_type: int = OUTPUT
+    flags: int = FLAG_DATA
+    message_id: uuid.UUID = field(default_factory=uuid.uuid4)
+    created_date: int = field(default_factory=lambda: int(time.time() * 1000))
+    schema_version: int = 1
+
+    def serialize(self) -> bytes:
+        return HEADER.pack(
+            HEADER_LENGTH,
+            self.message_type.encode().ljust(32, b' '),
+            self.schema_version,
+            self.created_date,
+            self.sequence_number,
+            self.flags,
+            uuid_to_bytes(self.message_id),
+            hashlib.sha256(self.payload).digest(),
+            self.payload_type,
+            len(self.payload),
+        ) + self.payload
+
+    @classmethod
+    def deserialize(cls, data: bytes) -> 'ClientMessage':
+        if len(data) < HEADER.size:
+            raise ValueError(f"data channel message too short, {len(data)} bytes")
+        (
+            header_length, message_type, schema_version, created_date, sequence_number,
+            flags, message_id, digest, payload_type, payload_length
+        ) = HEADER.unpack_from(data)
+
+        start = header_length + 4
+        payload = data[start:start + payload_length]
+        if len(payload) != payload_length:
+            raise ValueError("data channel message payload truncated")
+        if payload_length and hashlib.sha256(payload).digest() != digest:
+            raise ValueError("data channel message payload digest mismatch")
+
+        return cls(
+            message_type=message_type.decode().strip(' \x00'),
+            sequence_number=sequence_number,
+            payload=payload,
+            payload_type=payload_type,
+            flags=flags,
+            message_id=uuid_from_bytes(message_id),
+            created_date=created_date,
+            schema_version=schema_version,
+        )
+
+
+def uuid_to_bytes(value: uuid.UUID) -> bytes:
+    # the agent writes the least significant half first
+    raw = value.bytes
+    return raw[8:] + raw[:8]
+
+def uuid_from_bytes(raw: bytes) -> uuid.UUID:
+    return uuid.UUID(bytes=raw[8:] + raw[:8])
@@ -0,0 +1,197 @@
+import base64
+import hashlib
+import os
+import socket
+import ssl
+import struct
+import threading
+from typing import Tuple
+from urllib.parse import urlsplit
+
+import logging
+logger = logging.getLogger(__name__)
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class WebSocketClosed(ConnectionError):
+    pass
+
+
+class WebSocket:
+    """
+    Just enough RFC 6455 for the SSM data channel, whole messages in and out over an already upgraded socket.
+    Clients mask what they send and servers do not, mask says which side this is. Sends are serialised so
+    several threads can send, only one thread should receive.
+    """
+    def __init__(self, sock: socket.socket, mask: bool = True):
+        self.sock = sock
+        self.mask = mask
+        self.closed = False
+        self._send_lock = threading.Lock()
+        self._reader = sock.makefile('rb')
+
+    def send(self, payload: bytes, opcode: int = OP_BINARY):
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        mask_bit = 0x80 if self.mask else 0
+        if length < 126:
+            header.append(mask_bit | length)
+        elif length < 1 << 16:
+            header.append(mask_bit | 126)
+            header += struct.pack('!H', length)
+        else:
+            header.append(mask_bit | 127)
+            header += struct.pack('!Q', length)
+
+        if self.mask:
+            key = os.urandom(4)
+            header += key
+            payload = apply_mask(payload, key)
+
+        with self._send_lock:
+            if self.closed:
+                raise WebSocketClosed("websocket closed")
+            self.sock.sendall(bytes(header) + payload)
+
+    def recv(self) -> Tuple[int, bytes]:
+        """ The next text or binary message as (opcode, payload), pings are answered along the way """
+        message = bytearray()
+        message_opcode = None
+        while True:
+            fin, opcode, payload = self._recv_frame()
+            if opcode == OP_PING:
+                self.send(payload, OP_PONG)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                self.close()
+                raise WebSocketClosed("websocket closed by peer")
+
+            if opcode != OP_CONTINUATION:
+                message_opcode = opcode
+            message += payload
+            if fin:
+                return message_opcode, bytes(message)
+
+    def close(self):
+        with self._send_lock:
+            if self.closed:
+                return
+            self.closed = True
+        try:
+            frame = bytearray([0x80 | OP_CLOSE, 0x80 if self.mask else 0])
+            if self.mask:
+                frame += bytes(4)
+            self.sock.sendall(bytes(frame))
+        except OSError:
+            pass
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def _recv_frame(self) -> Tuple[bool, int, bytes]:
+        first, second = self._read(2)
+        fin = bool(first & 0x80)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length, = struct.unpack('!H', self._read(2))
+        elif length == 127:
+            length, = struct.unpack('!Q', self._read(8))
+        key = self._read(4) if second & 0x80 else None
+        payload = self._read(length)
+        if key is not None:
+            payload = apply_mask(payload, key)
+        return fin, opcode, payload
+
+    def _read(self, length: int) -> bytes:
+        data = self._reader.read(length)
+        if len(data) < length:
+            self.closed = True
+            raise WebSocketClosed("websocket connection lost")
+        return data
+
+
+def connect(url: str, timeout: float = 10) -> WebSocket:
+    """ Opens a ws:// or wss:// url and does the upgrade handshake """
+    parts = urlsplit(url)
+    secure = parts.scheme == 'wss'
+    port = parts.port or (443 if secure else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path = f"{path}?{parts.query}"
+
+    sock = socket.create_connection((parts.hostname, port), timeout)
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {parts.netloc}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            "\r\n"
+        )
+        sock.sendall(request.encode())
+
+        status, headers = read_http_head(sock)
+        if not status.startswith("HTTP/1.1 101"):
+            raise ConnectionError(f"websocket upgrade refused: {status}")
+        if headers.get('sec-websocket-accept') != accept_key(key):
+            raise ConnectionError("websocket upgrade returned the wrong accept key")
+        sock.settimeout(None)
+    except BaseException:
+        sock.close()
+        raise
+
+    logger.debug(f"websocket connected to {parts.hostname}:{port}")
+    return WebSocket(sock, mask=True)
+
+
+def read_http_head(sock: socket.socket) -> Tuple[str, dict]:
+    """ Reads up to the blank line a byte at a time, whatever follows belongs to the websocket """
+    head = bytearray()
+    while not head.endswith(b'\r\n\r\n'):
+        byte = sock.recv(1)
+        if not byte:
+            raise ConnectionError("connection closed during websocket handshake")
+        head += byte
+        if len(head) > 16 * 1024:
+            raise ConnectionError("websocket handshake response too large")
+
+    lines = head.decode('latin-1').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+
+def accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+
+
+def apply_mask(payload: bytes, key: bytes) -> bytes:
+    # xor as one big int rather than byte by byte, this is the hot path for every frame sent
+    length = len(payload)
+    if length == 0:
+        return payload
+    repeated = (key * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
@@ -0,0 +1,99 @@
+import os
+import secrets
+import time
+from pathlib import Path
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class FileLock:
+    """
+    Cross process lock using an exclusively created file. Using O_EXCL rather than fcntl keeps it
+    working on windows, a lock left behind by a dead process is broken once it is older than `stale` seconds.
+
+    The file holds a token unique to this holder. Release and breaking a stale lock both check it first, so a
+    lock that has since been broken and taken by someone else is never removed from under them.
+    """
+    def __init__(self, path: Path, stale: float = 30):
+        self.path = Path(path)
+        self.stale = stale
+        self.locked = False
+        self.token = None
+
+    def acquire(self, blocking: bool = True, timeout: float = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            token = f"{os.getpid()}:{secrets.token_hex(8)}"
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+            except FileExistsError:
+                self._break_stale()
+            else:
+                with os.fdopen(fd, 'w') as file:
+                    file.write(token)
+                self.token = token
+                self.locked = True
+                return True
+
+            if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                return False
+            time.sleep(0.01)
+
+    def release(self):
+        if not self.locked:
+            return
+        self.locked = False
+        token = read_token(self.path)
+        if token is None:
+            logger.warning(f"lock {self.path} already removed")
+            return
+        if token != self.token:
+            logger.warning(f"lock {self.path} was broken while held and is someone else's now, leaving it")
+            return
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            logger.warning(f"lock {self.path} already removed")
+
+    def _break_stale(self):
+        try:
+            age = time.time() - self.path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if age <= self.stale:
+            return
+        token = read_token(self.path)
+
+        # another waiter may break it and take the lock between the stat and here, so move the file aside
+        # rather than unlinking the path, then make sure what was moved is the stale lock that was looked at
+        moved = self.path.with_name(f"{self.path.name}.{secrets.token_hex(8)}.broken")
+        try:
+            os.rename(self.path, moved)
+        except FileNotFoundError:
+            return
+        if read_token(moved) == token:
+            logger.warning(f"breaking stale lock {self.path} age={age:.1f}s")
+        else:
+            # a fresh lock, put it back unless yet another one has been taken since
+            try:
+                os.link(moved, self.path)
+            except OSError as e:
+                logger.warning(f"could not put back lock {self.path} moved while breaking a stale one: {e}")
+        moved.unlink()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def read_token(path: Path) -> str:
+    """ The token in a lock file, None once it is gone """
+    try:
+        with open(path, 'r') as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
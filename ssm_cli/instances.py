@@ -1,34 +1,68 @@
-from dataclasses import dataclass, field
 from functools import cache
+from operator import attrgetter
 import json
-import re
+import queue
 import signal
+import socket
 import subprocess
 import sys
-from typing import Any, List
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Tuple
 
-import boto3
-from ssm_cli.selectors import SELECTORS
+from ssm_cli.cache import InventoryCache
+from ssm_cli.clients import get_client
+from ssm_cli.selectors import SELECTORS, ONLINE_ONLY
 from ssm_cli.config import config
 
+if TYPE_CHECKING:
+    import boto3
+    from ssm_cli.datachannel.channel import DataChannel
+
 import logging
 logger = logging.getLogger(__name__)
 
 
-@dataclass
 class Instance:
-    """ Save passing around giant objects, we only need handful of details for this tool """
-    id: str
-    name: str
-    ip: str
-    ping: str
+    """
+    Save passing around giant objects, we only need handful of details for this tool. Inventories run to 100k
+    of these so they are kept small, slots rather than a dict each, the few distinct ping/profile/region values
+    shared and the ip parsed into a sort key once when the instance is made.
+    """
+    __slots__ = ('id', 'name', 'ip', 'ping', 'profile', 'region', 'sort_key')
+    FIELDS = ('id', 'name', 'ip', 'ping', 'profile', 'region')
+
+    def __init__(self, id: str, name: str, ip: str, ping: str, profile: str = None, region: str = None):
+        self.id = id
+        self.name = name
+        self.ip = ip
+        self.ping = sys.intern(ping)
+        self.profile = None if profile is None else sys.intern(profile)
+        self.region = None if region is None else sys.intern(region)
+        self.sort_key = ip_sort_key(ip)
 
     def __str__(self):
-        return f"{self.id} {self.ip:<15} {self.ping:<7} {self.name}"
-    
+        if self.region is None:
+            return f"{self.id} {self.ip:<15} {self.ping:<7} {self.name}"
+        return f"{self.id} {self.ip:<15} {self.ping:<7} {self.profile}/{self.region} {self.name}"
+
+    def __repr__(self):
+        return f"Instance({', '.join(f'{field}={getattr(self, field)!r}' for field in self.FIELDS)})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Instance):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    __hash__ = None
+
+    def as_dict(self) -> dict:
+        """ The row kept in the inventory cache and written by list, Instance(**row) makes it back """
+        return {field: getattr(self, field) for field in self.FIELDS}
+
     def start_session(self, session):
         logger.debug(f"start session instance={self.id}")
-        client = session.client('ssm')
+        client = get_client(session, 'ssm')
 
         parameters = dict(
             Target=self.id
@@ -53,9 +87,9 @@ class Instance:
             logger.error(f"Failed to connect to session: {result.stderr.decode()}")
             raise RuntimeError(f"Failed to connect to session: {result.stderr.decode()}")
         
-    def start_port_forwarding_session_to_remote_host(self, session, host: str, remote_port: int, internal_port: int):
+    def start_port_forwarding_session_to_remote_host(self, session, host: str, remote_port: int, internal_port: int) -> subprocess.Popen:
         logger.debug(f"start port forwarding between localhost:{internal_port} and {host}:{remote_port} via {self.id}")
-        client = session.client('ssm')
+        client = get_client(session, 'ssm')
 
         parameters = dict(
             Target=self.id,
@@ -86,10 +120,36 @@ class Instance:
             ],
             stdout=subprocess.PIPE
         )
+        # readiness is up to the caller, see PortForward
+        return proc
 
-        for line in proc.stdout.readline():
-            if line == b'Waiting for connections...':
-                return
+    def start_port_forwarding_data_channel(self, session, host: str, remote_port: int, timeout: float = 30) -> 'DataChannel':
+        """ Same session as start_port_forwarding_session_to_remote_host, but spoken in process for one connection """
+        from ssm_cli.datachannel.channel import DataChannel
+
+        logger.debug(f"start data channel to {host}:{remote_port} via {self.id}")
+        client = get_client(session, 'ssm')
+
+        logger.info("calling out to ssm:StartSession")
+        response = client.start_session(
+            Target=self.id,
+            DocumentName='AWS-StartPortForwardingSessionToRemoteHost',
+            Parameters={
+                'host': [host],
+                'portNumber': [str(remote_port)]
+            }
+        )
+        session_id = response['SessionId']
+        logger.info(f"starting session: {session_id}")
+
+        def terminate():
+            try:
+                client.terminate_session(SessionId=session_id)
+            except Exception as e:
+                # the agent ends the session by itself once the channel goes, this just tidies up sooner
+                logger.debug(f"failed to terminate session {session_id}: {e}")
+
+        return DataChannel(response['StreamUrl'], response['TokenValue'], session_id, terminate).open(timeout)
 
 
 
@@ -111,13 +171,18 @@ def _session_manager_plugin( command: list) -> int:
 
 
 class Instances:
-    session: boto3.Session
+    session: 'boto3.Session'
+    cache: InventoryCache
 
-    def __init__(self, session):
+    def __init__(self, session, refresh: bool = False):
         self.session = session
-        
+        self.cache = InventoryCache(session, refresh) if config.cache.enabled else None
+
     def select_instance(self, group_tag_value: str, selector: str) -> Instance:
-        instances = sorted(self.list_instances(group_tag_value), key=lambda x: ip_as_int(x.ip))
+        online_only = selector in ONLINE_ONLY
+        # a day old inventory is fine to list, but connecting to an instance that has gone since needs it fresher
+        instances = self.list_instances(group_tag_value, online_only, config.cache.select_max_stale)
+        instances = sorted(instances, key=attrgetter('sort_key'))
         count = len(instances)
         if count == 1:
             return instances[0]
@@ -130,37 +195,53 @@ class Instances:
         self.selector = SELECTORS[selector]
         return self.selector(instances)
 
+    def session_for(self, instance: Instance) -> 'boto3.Session':
+        """ The session to use when connecting to an instance from this inventory """
+        return self.session
+
     def list_groups(self) -> List[str]:
-        groups = set()
+        return self._cached("groups", self._list_groups)
+
+    def list_instances(self, group_tag_value: str, online_only: bool = False, max_stale: int = None) -> List[Instance]:
+        name = f"instances:{group_tag_value}:online" if online_only else f"instances:{group_tag_value}"
+        rows = self._cached(
+            name,
+            lambda: [instance.as_dict() for instance in self.iter_instances(group_tag_value, online_only)],
+            max_stale
+        )
+        return [Instance(**row) for row in rows]
+
+    def iter_groups(self) -> Iterator[str]:
+        """ Uncached and unsorted, yields each group the first time it is seen """
+        seen = set()
         for resource in self._get_resources():
             value = get_tag(resource['Tags'], config.group_tag_key)
-            if value:
-                groups.add(value)
-        return sorted(list(groups))
+            if value and value not in seen:
+                seen.add(value)
+                yield value
+
+    def iter_instances(self, group_tag_value: str, online_only: bool = False) -> Iterator[Instance]:
+        """ Uncached and unsorted, yields instances as the pages they are on arrive """
+        return join_instances(
+            self._get_resources(group_tag_value),
+            self._describe_instance_information(group_tag_value, online_only)
+        )
 
-    def list_instances(self, group_tag_value: str) -> List[Instance]:
-        instances = []
-        instances_info = self._describe_instance_information(group_tag_value)
-        resources = self._get_resources(group_tag_value)
-
-        for resource in resources:
-            id = arn_to_instance_id(resource['ResourceARN'])
-            name = get_tag(resource['Tags'], 'Name')
-            for instance in instances_info:
-                if instance['InstanceId'] == id:
-                    instances.append(Instance(
-                        id,
-                        name,
-                        instance['IPAddress'],
-                        instance['PingStatus']
-                    ))
-
-        return instances
+    def _cached(self, name: str, fetch: Callable[[], Any], max_stale: int = None) -> Any:
+        if self.cache is None:
+            return fetch()
+        return self.cache.get(name, fetch, max_stale)
+
+    def _list_groups(self) -> List[str]:
+        return sorted(self.iter_groups())
+
+    def _client(self, name: str):
+        return get_client(self.session, name)
 
     def _get_resources(self, group_tag_value: str = None):
         logger.info("calling out to resourcegroupstaggingapi:GetResources")
 
-        client = self.session.client('resourcegroupstaggingapi')
+        client = self._client('resourcegroupstaggingapi')
         paginator = client.get_paginator('get_resources')
         tag_filter = {
             'Key': config.group_tag_key
@@ -183,21 +264,233 @@ class Instances:
         logger.debug(f"yielded {total} resources")
 
 
-    def _describe_instance_information(self, group_tag_value: str):
+    def _describe_instance_information(self, group_tag_value: str, online_only: bool = False):
         logger.info("calling out to ssm:DescribeInstanceInformation")
 
-        client = self.session.client('ssm')
-        response = client.describe_instance_information(
-            Filters=[
-                {
-                    'Key': f'tag:{config.group_tag_key}',
-                    'Values': [group_tag_value]
-                }
-            ]
-        )
-        logger.debug(f"found {len(response['InstanceInformationList'])} instances")
-        return response['InstanceInformationList']
+        client = self._client('ssm')
+        paginator = client.get_paginator('describe_instance_information')
+        filters = [
+            {
+                'Key': f'tag:{config.group_tag_key}',
+                'Values': [group_tag_value]
+            }
+        ]
+        if online_only:
+            filters.append({
+                'Key': 'PingStatus',
+                'Values': ['Online']
+            })
+
+        logger.debug(f"filtering on {filters}")
+        total = 0
+        for page in paginator.paginate(Filters=filters):
+            for instance in page['InstanceInformationList']:
+                total += 1
+                yield instance
+        logger.debug(f"found {total} instances")
+
+
+
+class MultiInstances(Instances):
+    """
+    Fans the inventory calls out over several profiles/regions, each target has its own deadline and a
+    target that fails or times out is logged and left out rather than failing the whole listing.
+    """
+    targets: List[Instances]
 
+    def __init__(self, targets: List[Instances]):
+        self.targets = targets
+        self._sessions = {(t.session.profile_name, t.session.region_name): t.session for t in targets}
+
+    def session_for(self, instance: Instance) -> 'boto3.Session':
+        return self._sessions[(instance.profile, instance.region)]
+
+    def list_groups(self) -> List[str]:
+        groups = set()
+        for _, result in self._fan_out(lambda target: target.list_groups()):
+            groups.update(result)
+        return sorted(groups)
+
+    def list_instances(self, group_tag_value: str, online_only: bool = False, max_stale: int = None) -> List[Instance]:
+        instances = []
+        for target, result in self._fan_out(lambda target: target.list_instances(group_tag_value, online_only, max_stale)):
+            for instance in result:
+                instance.profile = target.session.profile_name
+                instance.region = target.session.region_name
+                instances.append(instance)
+        return sorted(instances, key=attrgetter('sort_key'))
+
+    def iter_groups(self) -> Iterator[str]:
+        seen = set()
+        streams = [self._guarded(target, target.iter_groups()) for target in self.targets]
+        for _, group in iter_concurrently(*streams, timeout=config.fanout.timeout, on_timeout=self._timed_out):
+            if group not in seen:
+                seen.add(group)
+                yield group
+
+    def iter_instances(self, group_tag_value: str, online_only: bool = False) -> Iterator[Instance]:
+        streams = [self._guarded(target, target.iter_instances(group_tag_value, online_only)) for target in self.targets]
+        for position, instance in iter_concurrently(*streams, timeout=config.fanout.timeout, on_timeout=self._timed_out):
+            instance.profile = self.targets[position].session.profile_name
+            instance.region = self.targets[position].session.region_name
+            yield instance
+
+    def _guarded(self, target: Instances, stream: Iterator) -> Iterator:
+        # a failing target ends its own stream, the others carry on
+        try:
+            yield from stream
+        except Exception as e:
+            logger.error(f"{target.session.profile_name}/{target.session.region_name} failed: {e}")
+
+    def _timed_out(self, position: int):
+        target = self.targets[position]
+        logger.error(f"{target.session.profile_name}/{target.session.region_name} timed out after {config.fanout.timeout}s")
+
+    def _fan_out(self, call: Callable[[Instances], Any]) -> Iterator[Tuple[Instances, Any]]:
+        timeout = config.fanout.timeout
+        results = queue.Queue()
+        slots = threading.Semaphore(config.fanout.max_workers)
+        started = {}
+
+        def run(target):
+            with slots:
+                started[target] = time.monotonic()
+                try:
+                    results.put((target, call(target), None))
+                except Exception as e:
+                    results.put((target, None, e))
+
+        # daemon threads, a target left behind after timing out must not hold up the process exiting
+        for target in self.targets:
+            threading.Thread(target=run, args=(target,), name="fanout", daemon=True).start()
+
+        pending = set(self.targets)
+        while pending:
+            deadlines = [started[t] + timeout for t in pending if t in started]
+            wait_for = max(0, min(deadlines) - time.monotonic()) if deadlines else timeout
+            try:
+                target, result, error = results.get(timeout=wait_for)
+            except queue.Empty:
+                pass
+            else:
+                if target in pending:
+                    pending.discard(target)
+                    if error is None:
+                        yield target, result
+                    else:
+                        logger.error(f"{target.session.profile_name}/{target.session.region_name} failed: {error}")
+
+            now = time.monotonic()
+            for target in list(pending):
+                if target in started and now - started[target] >= timeout:
+                    logger.error(f"{target.session.profile_name}/{target.session.region_name} timed out after {timeout}s")
+                    pending.discard(target)
+
+
+def get_instances(session: 'boto3.Session', refresh: bool = False) -> Instances:
+    """ Instances for the session, or a MultiInstances when profiles/regions are configured """
+    if not config.profiles and not config.regions:
+        return Instances(session, refresh)
+
+    import boto3
+
+    # an unnamed profile comes from the environment, only pass on names that really exist
+    base_profile = session.profile_name if session.profile_name in session.available_profiles else None
+    targets = []
+    for profile in config.profiles or [base_profile]:
+        for region in config.regions or [None]:
+            try:
+                target = boto3.Session(profile_name=profile, region_name=region)
+            except Exception as e:
+                logger.error(f"skipping profile {profile}: {e}")
+                continue
+            if target.region_name is None:
+                logger.error(f"skipping profile {target.profile_name}, AWS config missing region")
+                continue
+            targets.append(Instances(target, refresh))
+
+    if not targets:
+        raise RuntimeError("no valid profile/region to query")
+    return MultiInstances(targets)
+
+
+def join_instances(resources: Iterable[dict], instances_info: Iterable[dict]) -> Iterator[Instance]:
+    """
+    Symmetric hash join of the tagging api resources and the InstanceInformationList. Both are paged
+    at the same time and an Instance is yielded as soon as both halves of it have arrived.
+    """
+    names: Dict[str, str] = {}
+    infos: Dict[str, Tuple[str, str]] = {}
+    for side, item in iter_concurrently(resources, instances_info):
+        if side == 0:
+            id = arn_to_instance_id(item['ResourceARN'])
+            name = get_tag(item['Tags'], 'Name')
+            info = infos.pop(id, None)
+            if info is None:
+                names[id] = name
+                continue
+        else:
+            id = item['InstanceId']
+            info = (item['IPAddress'], item['PingStatus'])
+            if id not in names:
+                infos[id] = info
+                continue
+            name = names.pop(id)
+        yield Instance(id, name, *info)
+
+def iter_concurrently(*iterables: Iterable, max_buffer: int = 1000, timeout: float = None, on_timeout: Callable[[int], None] = None) -> Iterator[Tuple[int, Any]]:
+    """
+    Drain each iterable on its own thread, yielding (position, item) in the order they arrive. With a timeout,
+    iterables still going that many seconds after the start are given up on, on_timeout is told their position.
+    """
+    items = queue.Queue(max_buffer)
+    stop = threading.Event()
+    done = object()
+
+    def put(value) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def drain(position, iterable):
+        try:
+            for item in iterable:
+                if not put((position, item)):
+                    return
+        except Exception as e:
+            put((position, e))
+        put((position, done))
+
+    # daemon threads, one still waiting on a page once we have stopped must not hold up the process exiting
+    for position, iterable in enumerate(iterables):
+        threading.Thread(target=drain, args=(position, iterable), name="inventory", daemon=True).start()
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    running = set(range(len(iterables)))
+    try:
+        while running:
+            wait_for = None if deadline is None else deadline - time.monotonic()
+            if wait_for is not None and wait_for <= 0:
+                for position in sorted(running):
+                    if on_timeout is not None:
+                        on_timeout(position)
+                return
+            try:
+                position, item = items.get(timeout=wait_for)
+            except queue.Empty:
+                continue
+            if item is done:
+                running.discard(position)
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield position, item
+    finally:
+        stop.set()
 
 
 def get_tag(tags: list, key: str) -> str:
@@ -214,8 +507,19 @@ def arn_to_instance_id(arn: str) -> str:
 	return parts[1]
 
 
-def ip_as_int(ip: str) -> int:
-    m = re.match(r'(\d+)\.(\d+)\.(\d+)\.(\d+)', ip)
-    if not m:
-        raise ValueError(f"Invalid IP address: {ip}")
-    return (int(m.group(1)) << 24) + (int(m.group(2)) << 16) + (int(m.group(3)) << 8) + int(m.group(4))
+# past every real address, whatever does not parse sorts last
+UNPARSEABLE_IP = 1 << 128
+
+
+def ip_sort_key(ip: str) -> int:
+    """ The address as a 128 bit int, ipv4 mapped into ipv6 (::ffff:a.b.c.d) so both kinds sort together """
+    if ip:
+        try:
+            return 0xffff00000000 | int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+        except OSError:
+            pass
+        try:
+            return int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+        except OSError:
+            pass
+    return UNPARSEABLE_IP
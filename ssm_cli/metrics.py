@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds, 0.5ms doubling up to about 17 minutes
+TIME_BUCKETS = [0.0005 * 2 ** i for i in range(22)]
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    """
+    Fixed bucket histogram, observing is a bisect and a few adds. Quantiles are the upper bound of the bucket
+    they fall in, so are accurate to within a factor of two, capped by the largest value seen.
+    """
+    def __init__(self, bounds: List[float] = TIME_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        """ Count and milliseconds """
+        summary = {"count": self.count}
+        if self.count:
+            summary["mean_ms"] = round(self.total / self.count * 1000, 1)
+            for q in QUANTILES:
+                summary[f"p{int(q * 100)}_ms"] = round(self.quantile(q) * 1000, 1)
+            summary["max_ms"] = round(self.max * 1000, 1)
+        return summary
+
+
+class ChannelMetrics:
+    """
+    Traffic for one forwarded channel. Only the forward serving the channel writes to it, so the byte counts
+    are plain attribute adds, Metrics folds them into its totals when the channel closes.
+
+    bytes_in is what came back from the instance and went to the ssh client, bytes_out went the other way.
+    """
+    __slots__ = ("metrics", "chanid", "destination", "requested", "first_byte", "bytes_in", "bytes_out", "closed")
+
+    def __init__(self, metrics: 'Metrics', chanid: int, destination: str):
+        self.metrics = metrics
+        self.chanid = chanid
+        self.destination = destination
+        self.requested = time.monotonic()
+        self.first_byte: Optional[float] = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.closed = False
+
+    def received(self, n: int):
+        if self.first_byte is None:
+            self.first_byte = time.monotonic() - self.requested
+            self.metrics.observe("first_byte", self.first_byte)
+        self.bytes_in += n
+
+    def sent(self, n: int):
+        self.bytes_out += n
+
+    def close(self, failed: bool = False):
+        if not self.closed:
+            self.closed = True
+            self.metrics._channel_closed(self, failed)
+
+
+class Metrics:
+    """
+    Process wide counters and histograms for the proxy, cheap enough to always collect. Histograms observed
+    with an instance id are also kept per instance, so a slow instance stands out from the rest.
+
+    start_reporting logs a json line every interval seconds while anything is happening, log_summary logs the totals.
+    """
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.instances: Dict[str, Dict[str, Histogram]] = {}
+        self.active: Set[ChannelMetrics] = set()
+        self._lock = threading.Lock()
+        self._reporter: threading.Thread = None
+        self._last_report = None
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self._add(name, n)
+
+    def observe(self, name: str, seconds: float, instance: str = None):
+        with self._lock:
+            self._histogram(self.histograms, name).observe(seconds)
+            if instance is not None:
+                self._histogram(self.instances.setdefault(instance, {}), name).observe(seconds)
+
+    def channel(self, chanid: int, destination: str) -> ChannelMetrics:
+        channel = ChannelMetrics(self, chanid, destination)
+        with self._lock:
+            self.active.add(channel)
+        return channel
+
+    def _channel_closed(self, channel: ChannelMetrics, failed: bool):
+        with self._lock:
+            self.active.discard(channel)
+            self._add("channels_failed" if failed else "channels_closed")
+            self._add("bytes_in", channel.bytes_in)
+            self._add("bytes_out", channel.bytes_out)
+            if not failed:
+                self._histogram(self.histograms, "channel_lifetime").observe(time.monotonic() - channel.requested)
+
+    def _add(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def _histogram(self, histograms: Dict[str, Histogram], name: str) -> Histogram:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        return histogram
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            active = list(self.active)
+            histograms = {name: histogram.summary() for name, histogram in self.histograms.items()}
+            instances = {
+                instance: {name: histogram.summary() for name, histogram in named.items()}
+                for instance, named in self.instances.items()
+            }
+        # open channels count towards the byte totals as they go, not only once they close
+        counters["bytes_in"] = counters.get("bytes_in", 0) + sum(channel.bytes_in for channel in active)
+        counters["bytes_out"] = counters.get("bytes_out", 0) + sum(channel.bytes_out for channel in active)
+        return {"active_channels": len(active), "counters": counters, "histograms": histograms, "instances": instances}
+
+    def start_reporting(self, interval: int):
+        """ Starts the periodic log lines, once per process however many servers call it """
+        if interval <= 0:
+            return
+        with self._lock:
+            if self._reporter is not None:
+                return
+            self._reporter = threading.Thread(target=self._report, args=(interval,), name="metrics", daemon=True)
+            self._reporter.start()
+
+    def log_summary(self):
+        logger.info(json.dumps({"event": "metrics_summary", **self.snapshot()}))
+
+    def _report(self, interval: int):
+        last = time.monotonic()
+        while True:
+            time.sleep(interval)
+            snapshot = self.snapshot()
+            now = time.monotonic()
+            if snapshot["active_channels"] == 0 and snapshot["counters"] == self._last_report:
+                last = now
+                continue
+
+            elapsed = now - last
+            previous = self._last_report or {}
+            counters = snapshot["counters"]
+            snapshot["bytes_in_per_s"] = round((counters["bytes_in"] - previous.get("bytes_in", 0)) / elapsed)
+            snapshot["bytes_out_per_s"] = round((counters["bytes_out"] - previous.get("bytes_out", 0)) / elapsed)
+            logger.info(json.dumps({"event": "metrics", **snapshot}))
+            self._last_report = counters
+            last = now
+
+
+metrics = Metrics()
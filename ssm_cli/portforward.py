@@ -0,0 +1,274 @@
+import re
+import socket
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+from ssm_cli.metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Backoff for probing the local port once the plugin says it is listening
+PROBE_DELAY = 0.005
+PROBE_MAX_DELAY = 0.25
+PORT_OPENED = re.compile(r"Port (\d+) opened for sessionId")
+
+
+class PortForward:
+    """
+    A running session-manager-plugin forwarding 127.0.0.1:local_port to host:remote_port through an instance.
+    AWS-StartPortForwardingSessionToRemoteHost takes many local connections, so one of these serves any number of channels.
+
+    started is when the session was asked for, timings records seconds from then to each phase of startup:
+    spawned (StartSession and the plugin process), listening (the plugin said so) and ready (first connection).
+    """
+    def __init__(self, instance, host: str, remote_port: int, local_port: int, proc: subprocess.Popen, ready_timeout: int = 30, started: float = None, on_close: Callable[[], None] = None, on_ready: Callable[[float], None] = None):
+        self.instance = instance
+        self.host = host
+        self.remote_port = remote_port
+        self.local_port = local_port
+        self.proc = proc
+        self.ready_timeout = ready_timeout
+        self.started = time.monotonic() if started is None else started
+        self.timings: Dict[str, float] = {"spawned": time.monotonic() - self.started}
+        self.ready = False
+        self.on_close = on_close
+        self.on_ready = on_ready
+        self.refs = 0
+        self.uses = 0
+        self.warm = False
+        self.last_used = time.monotonic()
+        self._listening = threading.Event()
+        self._ready_lock = threading.Lock()
+
+        # the plugin logs a line per connection, it would block once the pipe fills if nobody read it
+        threading.Thread(target=self._read_output, name=f"plugin-{local_port}", daemon=True).start()
+
+    def __repr__(self):
+        return f"PortForward(127.0.0.1:{self.local_port} -> {self.host}:{self.remote_port} via {self.instance.id})"
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def connect(self) -> socket.socket:
+        if self.ready:
+            return socket.create_connection(('127.0.0.1', self.local_port))
+        return self._wait_ready()
+
+    def close(self):
+        if self.alive:
+            logger.info(f"stopping {self!r}")
+            self.proc.terminate()
+            try:
+                self.proc.wait(5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        on_close, self.on_close = self.on_close, None
+        if on_close is not None:
+            on_close()
+
+    def _wait_ready(self) -> socket.socket:
+        """
+        Waits for the plugin to say it is listening, then probes the port with exponential backoff. The
+        first connection that works is handed back rather than thrown away. All of it has to happen within
+        ready_timeout of the session being started.
+        """
+        deadline = self.started + self.ready_timeout
+        if not self._listening.wait(max(0, deadline - time.monotonic())):
+            raise TimeoutError(f"{self!r} not listening after {self.ready_timeout}s")
+        if not self.alive:
+            raise ConnectionError(f"session manager plugin exited with {self.proc.returncode}")
+
+        delay = PROBE_DELAY
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                sock = socket.create_connection(('127.0.0.1', self.local_port))
+            except OSError as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.alive:
+                    raise ConnectionError(f"session manager plugin not accepting on 127.0.0.1:{self.local_port}: {e}")
+                logger.debug(f"probe {attempts} of 127.0.0.1:{self.local_port} failed: {e}")
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, PROBE_MAX_DELAY)
+                continue
+            self._mark_ready(attempts)
+            return sock
+
+    def _mark_ready(self, attempts: int):
+        with self._ready_lock:
+            if self.ready:
+                return
+            self.timings["ready"] = time.monotonic() - self.started
+            self.ready = True
+        spawned = self.timings["spawned"]
+        listening = self.timings.get("listening", spawned)
+        ready = self.timings["ready"]
+        metrics.observe("portforward_ready", ready, self.instance.id)
+        metrics.observe("portforward_plugin", listening - spawned, self.instance.id)
+        logger.info(
+            f"{self!r} ready in {ready * 1000:.0f}ms: start {spawned * 1000:.0f}ms, "
+            f"plugin {(listening - spawned) * 1000:.0f}ms, probe {(ready - listening) * 1000:.0f}ms ({attempts} attempts)"
+        )
+        if self.on_ready is not None:
+            self.on_ready(ready)
+
+    def _read_output(self):
+        for line in self.proc.stdout:
+            line = line.decode(errors='replace').strip()
+            if not line:
+                continue
+            logger.debug(f"plugin {self.local_port}: {line}")
+            if self._listening.is_set():
+                continue
+
+            opened = PORT_OPENED.match(line)
+            if opened and int(opened.group(1)) != self.local_port:
+                logger.warning(f"plugin opened port {opened.group(1)}, expected {self.local_port}")
+            if line == "Waiting for connections...":
+                self.timings["listening"] = time.monotonic() - self.started
+                self._listening.set()
+
+        # stdout closes when the plugin exits, stop anyone waiting for it to listen
+        self._listening.set()
+
+
+class ForwardSocket(socket.socket):
+    """ Socket connected to a PortForward, calls on_close once when it is closed so the forward can be released """
+    def __init__(self, sock: socket.socket, on_close: Callable[[], None]):
+        super().__init__(sock.family, sock.type, sock.proto, fileno=sock.detach())
+        self._on_close = on_close
+
+    def close(self):
+        super().close()
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close()
+
+
+class PortForwards:
+    """
+    Reuses port forwards per (instance, host, port). Each connection holds a reference, once a forward has had
+    no references for idle_timeout seconds its plugin process is stopped.
+
+    Forwards can also be warmed, started ahead of any channel asking for them. A warmed forward that is never
+    used is stopped after warm_idle_timeout. The portforward_hits/misses metrics count acquires that found a
+    running forward or had to start one, portforward_warm_hits is the hits served by a warmed forward's first use.
+    """
+    def __init__(self, start: Callable[[object, str, int], PortForward], idle_timeout: int = 300, warm_idle_timeout: int = 60):
+        self.start = start
+        self.idle_timeout = idle_timeout
+        self.warm_idle_timeout = warm_idle_timeout
+        self.forwards: Dict[Tuple[str, str, int], PortForward] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[str, str, int], threading.Lock] = {}
+        self._stopped = threading.Event()
+        threading.Thread(target=self._reap, name="portforward-reaper", daemon=True).start()
+
+    def connect(self, instance, host: str, remote_port: int) -> socket.socket:
+        """ A socket through a new or existing forward, the forward is held until the socket is closed """
+        forward = self.acquire(instance, host, remote_port)
+        try:
+            sock = forward.connect()
+        except Exception:
+            self.release(forward)
+            raise
+        return ForwardSocket(sock, lambda: self.release(forward))
+
+    def acquire(self, instance, host: str, remote_port: int) -> PortForward:
+        key = (instance.id, host, remote_port)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # starting a forward takes seconds, only hold up requests for the same destination
+        with key_lock:
+            dead = None
+            with self._lock:
+                forward = self.forwards.get(key)
+                if forward is not None and not forward.alive:
+                    logger.warning(f"{forward!r} exited, starting a new one")
+                    dead = self.forwards.pop(key)
+                    forward = None
+                if forward is not None:
+                    metrics.count("portforward_hits")
+                    if forward.warm and forward.uses == 0:
+                        metrics.count("portforward_warm_hits")
+                    forward.refs += 1
+                    forward.uses += 1
+                    logger.info(f"reusing {forward!r} refs={forward.refs}")
+                    return forward
+            metrics.count("portforward_misses")
+            if dead is not None:
+                # frees whatever it held, like its port lease, before the replacement asks for one
+                dead.close()
+
+            try:
+                forward = self.start(instance, host, remote_port)
+            except Exception:
+                metrics.count("portforward_failures")
+                raise
+            with self._lock:
+                forward.refs += 1
+                forward.uses += 1
+                self.forwards[key] = forward
+            logger.info(f"started {forward!r}")
+            return forward
+
+    def warm(self, instance, destinations: List[Tuple[str, int]]):
+        """ Starts forwards in the background, a channel asking for one while it is starting waits for it """
+        for host, remote_port in destinations:
+            threading.Thread(target=self._warm, args=(instance, host, remote_port), name=f"warm-{host}:{remote_port}", daemon=True).start()
+
+    def _warm(self, instance, host: str, remote_port: int):
+        key = (instance.id, host, remote_port)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self.forwards:
+                    return
+            try:
+                forward = self.start(instance, host, remote_port)
+            except Exception as e:
+                logger.warning(f"failed to warm {host}:{remote_port}: {e}")
+                metrics.count("portforward_failures")
+                return
+            forward.warm = True
+            with self._lock:
+                self.forwards[key] = forward
+            logger.info(f"warmed {forward!r}")
+
+    def release(self, forward: PortForward):
+        with self._lock:
+            forward.refs -= 1
+            forward.last_used = time.monotonic()
+            logger.debug(f"released {forward!r} refs={forward.refs}")
+
+    def close(self):
+        self._stopped.set()
+        with self._lock:
+            forwards, self.forwards = list(self.forwards.values()), {}
+        for forward in forwards:
+            forward.close()
+
+    def _reap(self):
+        while not self._stopped.wait(min(10, self.idle_timeout, self.warm_idle_timeout)):
+            now = time.monotonic()
+            with self._lock:
+                idle = [
+                    key for key, forward in self.forwards.items()
+                    if forward.refs <= 0 and now - forward.last_used >= self._idle_timeout(forward)
+                ]
+                expired = [self.forwards.pop(key) for key in idle]
+            for forward in expired:
+                logger.info(f"{forward!r} idle for {self._idle_timeout(forward)}s")
+                forward.close()
+
+    def _idle_timeout(self, forward: PortForward) -> int:
+        if forward.warm and forward.uses == 0:
+            return self.warm_idle_timeout
+        return self.idle_timeout
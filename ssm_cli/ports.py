@@ -0,0 +1,103 @@
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+from ssm_cli.filelock import FileLock
+from ssm_cli.xdg import get_runtime_root
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class PortLeases:
+    """
+    Local ports for session-manager-plugin to listen on. The kernel picks a free port (bind to 0), then it is
+    leased in a json file under the XDG runtime dir so another ssm process cannot be handed the same port
+    in the gap between us closing the socket and the plugin binding it.
+
+    A lease lasts until it is released, its process exits or ttl seconds pass, by then the plugin holds the port.
+    """
+    # bind to 0 only repeats a port after the ephemeral range wraps, so a clash is rare and a few tries is plenty
+    ATTEMPTS = 8
+
+    def __init__(self, path: Path = None, ttl: int = 30):
+        self.path = get_runtime_root() / 'ports.json' if path is None else Path(path)
+        self.lock = FileLock(self.path.with_suffix('.lock'), stale=5)
+        self.ttl = ttl
+
+    def allocate(self) -> int:
+        with self.lock:
+            leases = self._read()
+            for _ in range(self.ATTEMPTS):
+                port = kernel_port()
+                if str(port) not in leases:
+                    break
+                logger.debug(f"port {port} is leased by pid {leases[str(port)]['pid']}, trying again")
+            else:
+                raise RuntimeError(f"no unleased local port after {self.ATTEMPTS} attempts")
+
+            leases[str(port)] = {'pid': os.getpid(), 'expires': time.time() + self.ttl}
+            self._write(leases)
+        logger.debug(f"leased port {port}")
+        return port
+
+    def release(self, port: int):
+        with self.lock:
+            leases = self._read()
+            if leases.pop(str(port), None) is not None:
+                self._write(leases)
+        logger.debug(f"released port {port}")
+
+    def _read(self) -> Dict[str, dict]:
+        """ Current leases, anything expired or owned by a process that has gone is dropped """
+        try:
+            with self.path.open('r') as file:
+                leases = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"ignoring unreadable port leases {self.path}: {e}")
+            return {}
+
+        now = time.time()
+        return {
+            port: lease for port, lease in leases.items()
+            if lease['expires'] > now and pid_alive(lease['pid'])
+        }
+
+    def _write(self, leases: Dict[str, dict]):
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(leases, file)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def kernel_port() -> int:
+    """ A port nothing is listening on, picked by the kernel """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    # signal 0 would terminate the process on windows, there we leave it to the expiry
+    if sys.platform == "win32":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
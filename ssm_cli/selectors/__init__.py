@@ -1,7 +1,36 @@
 import ssm_cli.selectors.tui as tui
 import ssm_cli.selectors.first as first
+import ssm_cli.selectors.search as search
+import ssm_cli.selectors.fastest as fastest
+import ssm_cli.selectors.spread as spread
 
 SELECTORS = {
     'tui': tui.select,
-    'first': first.select
+    'first': first.select,
+    'search': search.select,
+    'fastest': fastest.select,
+    'spread': spread.select
+}
+
+# Selectors that will only ever pick an Online instance, this lets the listing filter on the AWS side
+ONLINE_ONLY = {
+    'first',
+    'fastest',
+    'spread'
+}
+
+# Selectors that ask the user, these need a terminal so cannot be run by the daemon
+INTERACTIVE = {
+    'tui',
+    'search'
+}
+
+# Selectors that learn from connections, called with the instance and the seconds its connection took to open, None if it failed
+CONNECTED = {
+    'fastest': fastest.connected
+}
+
+# Selectors that keep track of the connections they hand out, called with the instance when its connection ends
+RELEASES = {
+    'spread': spread.release
 }
@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ssm_cli.config import config
+from ssm_cli.filelock import FileLock
+from ssm_cli.xdg import get_cache_root
+
+import logging
+logger = logging.getLogger(__name__)
+
+# weight a new connection time gets against the score so far, one slow connection does not undo a good history
+SMOOTHING = 0.3
+
+
+class LatencyScores:
+    """
+    How long connections through each instance took to open, shared by every run through a json file in the XDG
+    cache dir. A score is used for ttl seconds. A failed connection is kept as None, the instance is passed over
+    for retry_failed seconds rather than the whole ttl.
+    """
+    def __init__(self, path: Path = None, ttl: int = 300, retry_failed: int = 60):
+        self.path = get_cache_root() / 'latency.json' if path is None else Path(path)
+        self.ttl = ttl
+        self.retry_failed = min(retry_failed, ttl)
+
+    def fresh(self) -> Dict[str, Optional[float]]:
+        return {id: score['latency'] for id, score in self._fresh(self._read()).items()}
+
+    def record(self, instance_id: str, latency: Optional[float]):
+        now = time.time()
+        with FileLock(self.path.with_suffix('.lock'), stale=5):
+            scores = self._fresh(self._read())
+            previous = scores.get(instance_id, {}).get('latency')
+            if latency is not None and previous is not None:
+                latency = previous + SMOOTHING * (latency - previous)
+            scores[instance_id] = {'latency': latency, 'measured': now}
+            fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix='.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as file:
+                    json.dump(scores, file)
+                os.replace(tmp, self.path)
+            except Exception:
+                os.unlink(tmp)
+                raise
+
+    def _fresh(self, scores: Dict[str, dict]) -> Dict[str, dict]:
+        now = time.time()
+        return {
+            id: score for id, score in scores.items()
+            if now - score['measured'] < (self.ttl if score['latency'] is not None else self.retry_failed)
+        }
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            with self.path.open('r') as file:
+                scores = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"ignoring unreadable latency scores {self.path}: {e}")
+            return {}
+        return scores if isinstance(scores, dict) else {}
+
+
+def scores() -> LatencyScores:
+    settings = config.selectors.fastest
+    return LatencyScores(ttl=settings.ttl, retry_failed=settings.retry_failed)
+
+
+def select(instances: List):
+    """
+    The Online instance whose connections have opened quickest. Nothing is probed, the scores come from the
+    connections proxycommand makes, so an instance without a score is picked first to get one.
+    """
+    online = [instance for instance in instances if instance.ping == "Online"]
+    if not online:
+        logger.error("No instance has ping Online")
+        return None
+
+    latencies = scores().fresh()
+    for instance in online:
+        if instance.id not in latencies:
+            logger.info(f"no connection time for {instance.id} yet, trying it")
+            return instance
+
+    measured = [instance for instance in online if latencies[instance.id] is not None]
+    if not measured:
+        logger.warning("connections through every instance failed recently, using the first Online one")
+        return online[0]
+    chosen = min(measured, key=lambda instance: latencies[instance.id])
+    logger.info(f"fastest instance {chosen.id} at {latencies[chosen.id] * 1000:.0f}ms")
+    return chosen
+
+
+def connected(instance, latency: Optional[float]):
+    scores().record(instance.id, latency)
+    if latency is None:
+        logger.info(f"connection through {instance.id} failed, passing it over for a while")
+    else:
+        logger.debug(f"connection through {instance.id} opened in {latency * 1000:.0f}ms")
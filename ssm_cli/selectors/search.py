@@ -0,0 +1,170 @@
+import os
+import sys
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SearchIndex:
+    """
+    Fuzzy search over instances, a query matches when its characters appear in order in the id, name or ip.
+    Lower cased search text for every instance is built once. Typing a character only searches the previous
+    matches, carrying on from where each one matched so far, backspace goes back to the previous results.
+    Matches keep the order the instances were given in.
+    """
+    def __init__(self, instances: list):
+        self.instances = instances
+        self.text = [f"{instance.id} {instance.name or ''} {instance.ip}".lower() for instance in instances]
+        # (query, matching positions in instances, end of the match so far in each one's text)
+        self._steps = [("", list(range(len(instances))), [-1] * len(instances))]
+
+    @property
+    def query(self) -> str:
+        return self._steps[-1][0]
+
+    @property
+    def matches(self) -> List[int]:
+        return self._steps[-1][1]
+
+    def push(self, char: str):
+        query, matches, ends = self._steps[-1]
+        char = char.lower()
+        text = self.text
+        narrowed = []
+        narrowed_ends = []
+        for position, end in zip(matches, ends):
+            found = text[position].find(char, end + 1)
+            if found >= 0:
+                narrowed.append(position)
+                narrowed_ends.append(found)
+        self._steps.append((query + char, narrowed, narrowed_ends))
+
+    def pop(self):
+        if len(self._steps) > 1:
+            self._steps.pop()
+
+    def set_query(self, query: str):
+        while self.query and not query.startswith(self.query):
+            self.pop()
+        for char in query[len(self.query):]:
+            self.push(char)
+
+
+class SearchView:
+    """ What is on screen, only the rows in the window are ever formatted """
+    def __init__(self, index: SearchIndex, height: int):
+        self.index = index
+        self.height = max(1, height)
+        self.cursor = 0
+        self.top = 0
+
+    def move(self, rows: int):
+        count = len(self.index.matches)
+        self.cursor = max(0, min(self.cursor + rows, count - 1))
+        if self.cursor < self.top:
+            self.top = self.cursor
+        elif self.cursor >= self.top + self.height:
+            self.top = self.cursor - self.height + 1
+
+    def reset(self):
+        self.cursor = 0
+        self.top = 0
+
+    def rows(self) -> List[str]:
+        matches = self.index.matches[self.top:self.top + self.height]
+        return [str(self.index.instances[position]) for position in matches]
+
+    def selected(self):
+        matches = self.index.matches
+        if not matches:
+            return None
+        return self.index.instances[matches[self.cursor]]
+
+
+def select(instances: list) -> Optional[object]:
+    with controlling_terminal() as available:
+        if not available:
+            logger.error("search needs a terminal to ask on, stdin/stdout are not one and there is no /dev/tty")
+            return None
+        return _select(instances)
+
+
+@contextmanager
+def controlling_terminal() -> Iterator[bool]:
+    """
+    Points stdin and stdout at the terminal while the selector runs. Under proxycommand they are the ssh stream,
+    the terminal ssh was started from is still reachable as /dev/tty. False when there is no terminal at all.
+    """
+    if os.isatty(0) and os.isatty(1):
+        yield True
+        return
+    try:
+        tty = os.open('/dev/tty', os.O_RDWR)
+    except OSError as e:
+        logger.debug(f"no controlling terminal: {e}")
+        yield False
+        return
+
+    sys.stdout.flush()
+    saved = [os.dup(0), os.dup(1)]
+    try:
+        os.dup2(tty, 0)
+        os.dup2(tty, 1)
+        yield True
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved[0], 0)
+        os.dup2(saved[1], 1)
+        for fd in (*saved, tty):
+            os.close(fd)
+
+
+def _select(instances: list) -> Optional[object]:
+    import blessed
+
+    term = blessed.Terminal()
+    index = SearchIndex(instances)
+    # prompt line at the top, status line at the bottom
+    view = SearchView(index, term.height - 2)
+
+    with term.fullscreen(), term.cbreak():
+        while True:
+            render(term, view)
+            try:
+                key = term.inkey()
+            except KeyboardInterrupt:
+                return None
+            if key.code == term.KEY_ENTER or key in ("\n", "\r"):
+                return view.selected()
+            if key.code == term.KEY_ESCAPE:
+                return None
+            if key.code in (term.KEY_BACKSPACE, term.KEY_DELETE) or key == "\x7f":
+                index.pop()
+                view.reset()
+            elif key.code == term.KEY_UP:
+                view.move(-1)
+            elif key.code == term.KEY_DOWN:
+                view.move(1)
+            elif key.code == term.KEY_PGUP:
+                view.move(-view.height)
+            elif key.code == term.KEY_PGDOWN:
+                view.move(view.height)
+            elif key.code == term.KEY_HOME:
+                view.move(-len(index.matches))
+            elif key.code == term.KEY_END:
+                view.move(len(index.matches))
+            elif not key.is_sequence and key.isprintable():
+                index.push(str(key))
+                view.reset()
+
+
+def render(term, view: SearchView):
+    lines = [term.bold(f"Which host? {view.index.query}")]
+    for row, line in enumerate(view.rows(), view.top):
+        line = line[:term.width - 2]
+        lines.append(term.reverse(f"> {line}") if row == view.cursor else f"  {line}")
+    lines += [""] * (view.height - len(lines) + 1)
+    lines.append(term.dim(f"{len(view.index.matches)}/{len(view.index.instances)} hosts, enter to pick, esc to cancel"))
+    print(term.home + "".join(line + term.clear_eol + "\n" for line in lines[:-1]) + lines[-1] + term.clear_eol, end="", flush=True)
@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from ssm_cli.config import config
+from ssm_cli.filelock import FileLock
+from ssm_cli.ports import pid_alive
+from ssm_cli.xdg import get_runtime_root
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Assignments:
+    """
+    Which instance every running proxycommand was sent to, kept in a json file under the XDG runtime dir so
+    concurrent processes see each other. Each assignment belongs to a pid and lasts until it is released, the
+    process exits or ttl seconds pass. When each instance was last picked is kept as well, to break ties.
+    """
+    def __init__(self, path: Path = None, ttl: int = 3600):
+        self.path = get_runtime_root() / 'spread.json' if path is None else Path(path)
+        self.lock = FileLock(self.path.with_suffix('.lock'), stale=5)
+        self.ttl = ttl
+
+    def assign(self, instances: list):
+        """ The instance with the fewest live assignments, the one picked longest ago when they are level """
+        with self.lock:
+            state = self._read()
+            counts = {instance.id: 0 for instance in instances}
+            for assignment in state['assignments']:
+                if assignment['instance'] in counts:
+                    counts[assignment['instance']] += 1
+            last_picked = state['last_picked']
+            chosen = min(instances, key=lambda instance: (counts[instance.id], last_picked.get(instance.id, 0)))
+
+            now = time.time()
+            state['assignments'].append({'pid': os.getpid(), 'instance': chosen.id, 'expires': now + self.ttl})
+            last_picked[chosen.id] = now
+            self._write(state)
+        logger.info(f"spread to {chosen.id}, it had {counts[chosen.id]} of {sum(counts.values())} connections")
+        return chosen
+
+    def release(self, instance_id: str):
+        """ Drops one of this process' assignments to the instance """
+        pid = os.getpid()
+        with self.lock:
+            state = self._read()
+            for assignment in state['assignments']:
+                if assignment['pid'] == pid and assignment['instance'] == instance_id:
+                    state['assignments'].remove(assignment)
+                    self._write(state)
+                    break
+        logger.debug(f"released spread assignment to {instance_id}")
+
+    def _read(self) -> dict:
+        """ Current state, assignments that expired or whose process has gone are dropped """
+        try:
+            with self.path.open('r') as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            state = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"ignoring unreadable spread state {self.path}: {e}")
+            state = {}
+
+        now = time.time()
+        return {
+            'assignments': [
+                assignment for assignment in state.get('assignments', [])
+                if assignment['expires'] > now and pid_alive(assignment['pid'])
+            ],
+            'last_picked': {
+                id: picked for id, picked in state.get('last_picked', {}).items()
+                if now - picked < self.ttl
+            },
+        }
+
+    def _write(self, state: dict):
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(state, file)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def select(instances: List):
+    online = [instance for instance in instances if instance.ping == "Online"]
+    if not online:
+        logger.error("No instance has ping Online")
+        return None
+    return Assignments(ttl=config.selectors.spread.ttl).assign(online)
+
+
+def release(instance):
+    Assignments(ttl=config.selectors.spread.ttl).release(instance.id)
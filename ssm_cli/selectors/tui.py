@@ -1,6 +1,6 @@
-import inquirer
-
 def select(instances: list) -> dict:
+    import inquirer
+
     questions = [
         inquirer.List(
             "host",
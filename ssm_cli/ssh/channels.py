@@ -1,4 +1,8 @@
 import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Dict, Tuple
+
 import paramiko
 
 import logging
@@ -6,32 +10,81 @@ logger = logging.getLogger(__name__)
 
 class Channels:
     """
-    This class was needed because of the multitheading and not always getting the channel we accept in the right order
+    paramiko hands out accepted channels in the order the client opened them, which is not the order our forward
+    and shell threads ask for them. A single acceptor thread takes every channel off the transport and routes it
+    to whoever is waiting on its chanid, so no caller ever blocks behind another one's accept.
+
+    A channel nobody has asked for yet is held until its waiter turns up, or closed after timeout seconds.
     """
+    # How often the acceptor looks at whether the transport is still up and for unclaimed channels
+    ACCEPT_POLL = 1
+
     def __init__(self, transport: paramiko.Transport, timeout=10):
         self.transport = transport
         self.timeout = timeout
-        self._channels = {}
-        self._channels_lock = threading.Lock()
+        self._waiters: Dict[int, Future] = {}
+        self._unclaimed: Dict[int, Tuple[paramiko.Channel, float]] = {}
+        self._lock = threading.Lock()
+        self._acceptor = None
 
     def get_channel(self, chanid: int):
         logger.debug(f"getting channel {chanid}")
-        with self._channels_lock:
-            if chanid in self._channels:
-                chan = self._channels[chanid]
-                del self._channels[chanid]
-                logger.debug(f"got channel from buffer")
-                return chan
-
-            for attempt in range(3):
-                chan = self.transport.accept(self.timeout)
-                if chan is None: # Timeout
-                    logger.error(f"no channel available")
-                    return None
- 
-                if chan.get_id() != chanid:
-                    self._channels[chan.get_id()] = chan
-                    logger.error(f"channel ID mismatch, attempt {attempt}, trying again")
-                    continue
-                logger.debug("got channel from transport")
-                return chan
\ No newline at end of file
+        future = self.channel_future(chanid)
+        try:
+            chan = future.result(self.timeout)
+        except TimeoutError:
+            chan = self.give_up(chanid, future)
+            if chan is None:
+                logger.error(f"no channel available chan={chanid}")
+                return None
+        logger.debug("got channel from transport")
+        return chan
+
+    def channel_future(self, chanid: int) -> Future:
+        """ Future for the channel without blocking, it resolves to None if the transport closes first """
+        with self._lock:
+            if chanid in self._unclaimed:
+                chan, _ = self._unclaimed.pop(chanid)
+                future = Future()
+                future.set_result(chan)
+                return future
+            future = self._waiters.setdefault(chanid, Future())
+            if self._acceptor is None:
+                self._acceptor = threading.Thread(target=self._accept_loop, name="channel-acceptor", daemon=True)
+                self._acceptor.start()
+            return future
+
+    def give_up(self, chanid: int, future: Future):
+        """ Stops waiting for the channel, returns it if it turned up in the meantime """
+        with self._lock:
+            if self._waiters.get(chanid) is future:
+                del self._waiters[chanid]
+            return future.result() if future.done() else None
+
+    def _accept_loop(self):
+        while self.transport.is_active():
+            chan = self.transport.accept(self.ACCEPT_POLL)
+            with self._lock:
+                if chan is not None:
+                    future = self._waiters.pop(chan.get_id(), None)
+                    if future is not None and future.set_running_or_notify_cancel():
+                        future.set_result(chan)
+                    else:
+                        self._unclaimed[chan.get_id()] = (chan, time.monotonic())
+                expired = self._expire()
+
+            for chan in expired:
+                logger.warning(f"closing channel nobody claimed chan={chan.get_id()}")
+                chan.close()
+
+        logger.debug("transport closed, channel acceptor stopping")
+        with self._lock:
+            waiters, self._waiters = list(self._waiters.values()), {}
+        for future in waiters:
+            if future.set_running_or_notify_cancel():
+                future.set_result(None)
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [chanid for chanid, (_, accepted) in self._unclaimed.items() if now - accepted > self.timeout]
+        return [self._unclaimed.pop(chanid)[0] for chanid in expired]
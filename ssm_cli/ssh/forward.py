@@ -1,34 +1,96 @@
 import select
+import socket
 import threading
 
+import paramiko
+
+from ssm_cli.metrics import ChannelMetrics, metrics
+
 import logging
 logger = logging.getLogger(__name__)
 
+# Upper bound for the adaptive chunk size, the SSH window is usually larger than is worth buffering
+MAX_CHUNK_SIZE = 1024 * 1024
+
 class ForwardThread(threading.Thread):
-    def __init__(self, sock, chanid, channels, chunk_size=1024):
+    def __init__(self, sock, chanid, channels, chunk_size=16 * 1024, stats: ChannelMetrics = None):
         threading.Thread.__init__(self)
-        
+
         logger.debug(f"setting up forward thread chan={chanid}")
         self.sock = sock
         self.chanid = chanid
         self.channels = channels
         self.chunk_size = chunk_size
+        self.stats = metrics.channel(chanid, None) if stats is None else stats
 
     def run(self):
         logger.info(f"starting forward thread chan={self.chanid}")
 
         chan = self.channels.get_channel(self.chanid)
-        while True:
-            r, _, _ = select.select([chan, self.sock], [], [])
+        if chan is None:
+            logger.error(f"failed to get channel chan={self.chanid}")
+            self.sock.close()
+            self.stats.close(failed=True)
+            return
+
+        try:
+            self.pump(chan)
+        except OSError as e:
+            logger.warning(f"forward failed chan={self.chanid}: {e}")
+        finally:
+            logger.info(f"closing forward chan={self.chanid}")
+            self.sock.close()
+            chan.close()
+            self.stats.close()
+
+    def pump(self, chan: paramiko.Channel):
+        """
+        Copies both ways until both sides have sent EOF. Socket reads go into one preallocated buffer and
+        are sent on as memoryview slices, a chunk size doubles each time a read fills it, up to the SSH window.
+        EOF from one side is passed on as a half close so the other direction can finish.
+        """
+        max_chunk = max(self.chunk_size, min(MAX_CHUNK_SIZE, max(chan.in_window_size, chan.out_window_size)))
+        buffer = memoryview(bytearray(max_chunk))
+        sock_chunk = chan_chunk = self.chunk_size
+        sock_open = chan_open = True
+
+        while sock_open or chan_open:
+            readable = [s for s, is_open in ((self.sock, sock_open), (chan, chan_open)) if is_open]
+            # after channel EOF its fd stays readable, so only the timeout notices the channel closing
+            r, _, _ = select.select(readable, [], [], None if chan_open else 1.0)
+
             if self.sock in r:
-                data = self.sock.recv(self.chunk_size)
-                if len(data) == 0:
-                    break
-                chan.send(data)
+                n = self.sock.recv_into(buffer[:sock_chunk])
+                if n == 0:
+                    logger.debug(f"socket EOF chan={self.chanid}")
+                    sock_open = False
+                    chan.shutdown_write()
+                else:
+                    send_all(chan, buffer[:n])
+                    self.stats.sent(n)
+                    if n == sock_chunk:
+                        sock_chunk = min(sock_chunk * 2, max_chunk)
 
             if chan in r:
-                data = chan.recv(self.chunk_size)
+                data = chan.recv(chan_chunk)
                 if len(data) == 0:
-                    break
-                self.sock.send(data)
-    
\ No newline at end of file
+                    logger.debug(f"channel EOF chan={self.chanid}")
+                    chan_open = False
+                    self.sock.shutdown(socket.SHUT_WR)
+                else:
+                    self.sock.sendall(data)
+                    self.stats.received(len(data))
+                    if len(data) == chan_chunk:
+                        chan_chunk = min(chan_chunk * 2, max_chunk)
+
+            if chan.closed:
+                break
+
+
+def send_all(chan: paramiko.Channel, data: memoryview):
+    """ Channel.send only takes what fits in the window and packet, keep slicing until it is all gone """
+    while data:
+        sent = chan.send(data)
+        if sent == 0:
+            raise ConnectionError("channel closed")
+        data = data[sent:]
@@ -0,0 +1,249 @@
+import asyncio
+import socket
+import threading
+
+import paramiko
+
+from ssm_cli.metrics import ChannelMetrics, metrics
+from ssm_cli.ssh.channels import Channels
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ForwardLoop(threading.Thread):
+    """
+    Serves every forwarded channel from a single asyncio event loop, rather than a thread per channel.
+    Each direction has a bounded buffer, once it is full we stop reading from that side until it drains.
+    """
+    daemon = True
+
+    def __init__(self, channels: Channels, max_buffer: int = 256 * 1024, chunk_size: int = 32 * 1024):
+        threading.Thread.__init__(self, name="forward-loop")
+        self.channels = channels
+        self.max_buffer = max_buffer
+        self.chunk_size = chunk_size
+        self.forwards = set()
+        # sockets waiting on their channel, chanid -> (sock, stats)
+        self.waiting = {}
+        # paramiko channel fds are pipes (socketpairs on windows), which the proactor loop cannot watch
+        self.loop = asyncio.SelectorEventLoop()
+
+    def run(self):
+        logger.info("starting forward loop")
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def forward(self, sock: socket.socket, chanid: int, stats: ChannelMetrics = None):
+        """ Thread safe, called from the transport thread when a direct-tcpip channel is opened """
+        if stats is None:
+            stats = metrics.channel(chanid, None)
+        self.loop.call_soon_threadsafe(self._accept, sock, chanid, stats)
+
+    def stop(self, timeout: float = 5):
+        """ Thread safe, closes whatever is still forwarding then ends the loop and frees its selector """
+        if self.is_alive():
+            self.loop.call_soon_threadsafe(self._shutdown)
+            self.join(timeout)
+        if self.is_alive():
+            logger.warning("forward loop did not stop in time")
+            return
+        self.loop.close()
+        logger.info("forward loop stopped")
+
+    def _shutdown(self):
+        for forward in list(self.forwards):
+            forward.close()
+        for sock, stats in self.waiting.values():
+            sock.close()
+            stats.close(failed=True)
+        self.waiting.clear()
+        self.loop.stop()
+
+    def _accept(self, sock: socket.socket, chanid: int, stats: ChannelMetrics):
+        self.waiting[chanid] = (sock, stats)
+        # the channels acceptor resolves the future, nothing blocks waiting for it
+        future = self.channels.channel_future(chanid)
+        timeout = self.loop.call_later(self.channels.timeout, self._give_up, sock, chanid, future, stats)
+        asyncio.wrap_future(future, loop=self.loop).add_done_callback(lambda f: self._start(sock, chanid, f, timeout, stats))
+
+    def _give_up(self, sock: socket.socket, chanid: int, future, stats: ChannelMetrics):
+        if self.channels.give_up(chanid, future) is None:
+            self.waiting.pop(chanid, None)
+            logger.error(f"no channel available chan={chanid}")
+            sock.close()
+            stats.close(failed=True)
+
+    def _start(self, sock: socket.socket, chanid: int, future: asyncio.Future, timeout: asyncio.TimerHandle, stats: ChannelMetrics):
+        timeout.cancel()
+        if self.waiting.pop(chanid, None) is None:
+            # stopped while it waited, the socket is already closed
+            return
+        chan = None if future.cancelled() or future.exception() else future.result()
+        if chan is None:
+            logger.error(f"failed to get channel chan={chanid}")
+            sock.close()
+            stats.close(failed=True)
+            return
+        logger.info(f"forwarding chan={chanid} on loop, {len(self.forwards) + 1} active")
+        self.forwards.add(LoopForward(self.loop, sock, chan, self.max_buffer, self.chunk_size, self.forwards.discard, stats))
+
+
+class LoopForward:
+    """
+    Copies between a socket and a channel using loop callbacks. EOF from one side is passed on as a half
+    close once its buffer is flushed, the forward is torn down when both directions are done.
+    """
+    # paramiko has no fd to say the send window opened again, so a full channel is retried on a timer
+    CHAN_RETRY = 0.002
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, sock: socket.socket, chan: paramiko.Channel, max_buffer: int, chunk_size: int, on_close: callable, stats: ChannelMetrics):
+        self.loop = loop
+        self.sock = sock
+        self.chan = chan
+        self.chanid = chan.get_id()
+        self.max_buffer = max_buffer
+        self.chunk_size = chunk_size
+        self.on_close = on_close
+        self.stats = stats
+
+        self.to_chan = bytearray()
+        self.to_sock = bytearray()
+        self.sock_eof = False
+        self.chan_eof = False
+        self.chan_shut = False
+        self.sock_shut = False
+        self.closed = False
+        self._reading_sock = False
+        self._reading_chan = False
+        self._chan_retry = None
+
+        sock.setblocking(False)
+        chan.settimeout(0.0)
+        self._chan_fd = chan.fileno()
+        self._resume()
+
+    def _resume(self):
+        if not self.sock_eof and not self._reading_sock and len(self.to_chan) < self.max_buffer:
+            self.loop.add_reader(self.sock, self._read_sock)
+            self._reading_sock = True
+        if not self.chan_eof and not self._reading_chan and len(self.to_sock) < self.max_buffer:
+            self.loop.add_reader(self._chan_fd, self._read_chan)
+            self._reading_chan = True
+
+    def _pause_sock(self):
+        if self._reading_sock:
+            self.loop.remove_reader(self.sock)
+            self._reading_sock = False
+
+    def _pause_chan(self):
+        if self._reading_chan:
+            self.loop.remove_reader(self._chan_fd)
+            self._reading_chan = False
+
+    def _read_sock(self):
+        try:
+            data = self.sock.recv(self.chunk_size)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            logger.warning(f"socket read failed chan={self.chanid}: {e}")
+            data = b''
+
+        if not data:
+            logger.debug(f"socket EOF chan={self.chanid}")
+            self.sock_eof = True
+            self._pause_sock()
+        else:
+            self.stats.sent(len(data))
+            self.to_chan += data
+            if len(self.to_chan) >= self.max_buffer:
+                self._pause_sock()
+        self._flush_chan()
+
+    def _read_chan(self):
+        try:
+            data = self.chan.recv(self.chunk_size)
+        except socket.timeout:
+            return
+
+        if not data:
+            logger.debug(f"channel EOF chan={self.chanid}")
+            self.chan_eof = True
+            self._pause_chan()
+        else:
+            self.stats.received(len(data))
+            self.to_sock += data
+            if len(self.to_sock) >= self.max_buffer:
+                self._pause_chan()
+        self._flush_sock()
+
+    def _flush_chan(self):
+        if self._chan_retry is not None:
+            self._chan_retry.cancel()
+            self._chan_retry = None
+        while self.to_chan:
+            try:
+                sent = self.chan.send(self.to_chan[:self.chunk_size])
+            except socket.timeout:
+                break
+            except OSError as e:
+                logger.warning(f"channel write failed chan={self.chanid}: {e}")
+                return self.close()
+            if sent == 0:
+                logger.debug(f"channel closed by client chan={self.chanid}")
+                return self.close()
+            del self.to_chan[:sent]
+
+        if self.to_chan:
+            self._chan_retry = self.loop.call_later(self.CHAN_RETRY, self._flush_chan)
+        elif self.sock_eof and not self.chan_shut:
+            self.chan.shutdown_write()
+            self.chan_shut = True
+        self._resume()
+        self._check_done()
+
+    def _flush_sock(self):
+        while self.to_sock:
+            try:
+                sent = self.sock.send(self.to_sock)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                logger.warning(f"socket write failed chan={self.chanid}: {e}")
+                return self.close()
+            del self.to_sock[:sent]
+
+        if self.to_sock:
+            self.loop.add_writer(self.sock, self._flush_sock)
+        else:
+            self.loop.remove_writer(self.sock)
+            if self.chan_eof and not self.sock_shut:
+                try:
+                    self.sock.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+                self.sock_shut = True
+        self._resume()
+        self._check_done()
+
+    def _check_done(self):
+        if self.closed:
+            return
+        if (self.chan_shut and self.sock_shut) or (self.chan.closed and not self.to_sock):
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        logger.info(f"closing forward chan={self.chanid}")
+        self._pause_sock()
+        self._pause_chan()
+        self.loop.remove_writer(self.sock)
+        if self._chan_retry is not None:
+            self._chan_retry.cancel()
+        self.sock.close()
+        self.chan.close()
+        self.stats.close()
+        self.on_close(self)
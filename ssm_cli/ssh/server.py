@@ -1,10 +1,13 @@
 import threading
+import time
 import paramiko
 
 from ssm_cli.ssh.transport import StdIoSocket
 from ssm_cli.ssh.shell import ShellThread
 from ssm_cli.ssh.forward import ForwardThread
+from ssm_cli.ssh.forward_loop import ForwardLoop
 from ssm_cli.ssh.channels import Channels
+from ssm_cli.metrics import metrics
 from ssm_cli.xdg import get_ssh_hostkey
 
 import logging
@@ -16,27 +19,40 @@ class SshServer(paramiko.ServerInterface):
     """
     event: threading.Event
     direct_tcpip_callback: callable
+    forward_engine: str
+    forward_loop: ForwardLoop = None
     
-    def __init__(self, direct_tcpip_callback: callable):
+    def __init__(self, direct_tcpip_callback: callable, forward_engine: str = "asyncio", host_key: paramiko.PKey = None):
         logger.debug("creating server")
+        if forward_engine not in ("asyncio", "thread"):
+            raise ValueError(f"invalid forward engine {forward_engine}")
         self.event = threading.Event()
         self.direct_tcpip_callback = direct_tcpip_callback
+        self.forward_engine = forward_engine
+        self.host_key = host_key
     
-    def start(self):
+    def start(self, sock=None):
+        """ Serves ssh on sock until the client goes away, stdin/stdout when no sock is given """
         logger.info("starting server")
 
-        sock = StdIoSocket()
+        if sock is None:
+            sock = StdIoSocket()
         self.transport = paramiko.Transport(sock)
         self.channels = Channels(self.transport)
 
-        key_path = get_ssh_hostkey()
-        host_key = paramiko.RSAKey(filename=key_path)
-        logger.info("Loaded existing host key")
-        
-        self.transport.add_server_key(host_key)
+        if self.host_key is None:
+            self.host_key = load_host_key()
+
+        self.transport.add_server_key(self.host_key)
         self.transport.start_server(server=self)
 
-        self.event.wait()
+        # the transport thread ends once the client disconnects or stdin reaches EOF
+        while self.transport.is_active() and not self.event.wait(1):
+            pass
+        logger.info("transport finished, stopping server")
+        self.transport.close()
+        if self.forward_loop is not None:
+            self.forward_loop.stop()
 
     # Auth handlers, just allow anything. The only use of this code is ProxyCommand and auth is not needed
     def get_allowed_auths(self, username):
@@ -76,19 +92,35 @@ class SshServer(paramiko.ServerInterface):
         host = destination[0]
         remote_port = destination[1]
 
+        stats = metrics.channel(chanid, f"{host}:{remote_port}")
         sock = self.direct_tcpip_callback(host, remote_port)
+        metrics.observe("forward_open", time.monotonic() - stats.requested)
         
         if not sock:
             logger.error("failed to connect to session manager plugin")
+            stats.close(failed=True)
             return paramiko.OPEN_FAILED_CONNECT_FAILED
         
-        # Start thread to open the channel and forward data
-        t = ForwardThread(sock, chanid, self.channels)
-        t.start()
-        
-        logger.debug("started forwarding thread")
+        if self.forward_engine == "thread":
+            # Start thread to open the channel and forward data
+            t = ForwardThread(sock, chanid, self.channels, stats=stats)
+            t.start()
+            logger.debug("started forwarding thread")
+        else:
+            if self.forward_loop is None:
+                self.forward_loop = ForwardLoop(self.channels)
+                self.forward_loop.start()
+            self.forward_loop.forward(sock, chanid, stats)
+            logger.debug("handed forward to loop")
+
         return paramiko.OPEN_SUCCEEDED
     
     def get_banner(self):
         return ("SSM CLI - ProxyCommand SSH server\r\n", "en-US")
 
+def load_host_key() -> paramiko.PKey:
+    key_path = get_ssh_hostkey()
+    host_key = paramiko.RSAKey(filename=key_path)
+    logger.info("Loaded existing host key")
+    return host_key
+
@@ -1,22 +1,108 @@
+import os
+import select
+import socket
 import sys
+import threading
 
 import logging
 logger = logging.getLogger(__name__)
 
 class StdIoSocket:
-    _closed = True
-
-    def send(self, bytes):
-        n = sys.stdout.buffer.write(bytes)
-        sys.stdout.flush()
-        return n
-    def recv(self, length):
-        return sys.stdin.buffer.read(length)
-    
-    # ignore close for now, we can probably handle it
+    """
+    Socket like wrapper around the raw stdin/stdout file descriptors, which is what paramiko sees as the
+    connection when running as a ProxyCommand.
+
+    Sends are queued and written by a single writer thread, whatever has queued up while the previous write
+    was in progress goes out in one os.write. An idle connection still writes each packet straight away, but
+    under load many small SSH packets cost one syscall. Reads are buffered and honour settimeout through select.
+    """
+    # Stop queueing once this much is waiting on stdout, so a slow reader pushes back on paramiko
+    MAX_PENDING = 1024 * 1024
+    # paramiko reads a packet in several small pieces, read ahead so that is not a syscall each
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, stdin_fd: int = None, stdout_fd: int = None):
+        self.stdin_fd = sys.stdin.fileno() if stdin_fd is None else stdin_fd
+        self.stdout_fd = sys.stdout.fileno() if stdout_fd is None else stdout_fd
+        self.timeout = None
+        self._closed = False
+        self._eof = False
+        self._error = None
+        self._read_buffer = bytearray()
+
+        self._pending = []
+        self._pending_size = 0
+        self._cond = threading.Condition()
+        self._writer = threading.Thread(target=self._write_loop, name="stdout-writer", daemon=True)
+        self._writer.start()
+
+    def send(self, data) -> int:
+        with self._cond:
+            while self._pending_size >= self.MAX_PENDING and not self._closed and self._error is None:
+                if not self._cond.wait(self.timeout):
+                    raise socket.timeout()
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise OSError("stdio socket closed")
+            self._pending.append(bytes(data))
+            self._pending_size += len(data)
+            self._cond.notify_all()
+        return len(data)
+
+    def recv(self, length: int) -> bytes:
+        if not self._read_buffer:
+            if self._eof or self._closed:
+                return b''
+            # select does not work on windows pipes, there we just block
+            if self.timeout is not None and sys.platform != "win32":
+                r, _, _ = select.select([self.stdin_fd], [], [], self.timeout)
+                if not r:
+                    raise socket.timeout()
+            data = os.read(self.stdin_fd, max(length, self.READ_SIZE))
+            if not data:
+                logger.info("EOF on stdin")
+                self._eof = True
+                return b''
+            if len(data) <= length:
+                return data
+            self._read_buffer += data
+
+        data = bytes(self._read_buffer[:length])
+        del self._read_buffer[:length]
+        return data
+
+    def settimeout(self, timeout: float):
+        self.timeout = timeout
+
     def close(self):
-        logger.debug("Ignoring close")
+        """ Flushes anything still queued, then stops the writer """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join(5)
+        logger.debug("closed stdio socket")
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                chunks, self._pending, self._pending_size = self._pending, [], 0
+                self._cond.notify_all()
 
-    # timeout should be used, for now we are ignoring it
-    def settimeout(self, timeout):
-        logger.debug("Ignoring settimeout")
+            data = memoryview(b''.join(chunks) if len(chunks) > 1 else chunks[0])
+            try:
+                while data:
+                    written = os.write(self.stdout_fd, data)
+                    data = data[written:]
+            except OSError as e:
+                logger.error(f"failed writing to stdout: {e}")
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
@@ -1,6 +1,9 @@
 # All XDG path logic here
+import os
+import stat
+import tempfile
 from pathlib import Path
-from xdg_base_dirs import xdg_config_home
+from xdg_base_dirs import xdg_cache_home, xdg_config_home, xdg_runtime_dir
 
 
 def get_conf_root(check=True) -> Path:
@@ -27,3 +30,32 @@ def get_ssh_hostkey(check=True) -> Path:
     if check and not path.exists():
         raise EnvironmentError(f"{path} missing, run `ssm setup` to create")
     return path
+
+def get_cache_root() -> Path:
+    root = xdg_cache_home() / 'ssm-cli'
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+def get_runtime_root() -> Path:
+    """ Per user state shared by running processes, XDG_RUNTIME_DIR is not set on every platform so fall back to tmp """
+    runtime = xdg_runtime_dir()
+    if runtime is None:
+        user = os.getuid() if hasattr(os, 'getuid') else os.getlogin()
+        runtime = Path(tempfile.gettempdir()) / f'ssm-cli-{user}'
+        runtime.mkdir(mode=0o700, exist_ok=True)
+        check_private_dir(runtime)
+    root = runtime / 'ssm-cli'
+    root.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return root
+
+def check_private_dir(path: Path):
+    """ tmp is shared, anyone could have made the directory first, so it has to be ours and closed to everyone else """
+    if not hasattr(os, 'getuid'):
+        return
+    info = path.lstat()
+    if not stat.S_ISDIR(info.st_mode):
+        raise EnvironmentError(f"{path} is not a directory, remove it or set XDG_RUNTIME_DIR")
+    if info.st_uid != os.getuid():
+        raise EnvironmentError(f"{path} is owned by another user, remove it or set XDG_RUNTIME_DIR")
+    if info.st_mode & 0o077:
+        raise EnvironmentError(f"{path} is open to other users, chmod it 700 or set XDG_RUNTIME_DIR")
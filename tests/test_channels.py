@@ -0,0 +1,47 @@
+import socket
+import threading
+import time
+
+import paramiko
+import pytest
+
+from benchmarks.channels import open_many
+from benchmarks.fakes import start_echo_server
+from ssm_cli.ssh.server import SshServer
+
+# enough to have channels opening while others are still being routed, small enough to run with every test
+CHANNELS = 50
+
+
+def wait_for(condition, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+@pytest.mark.parametrize("engine", ["asyncio", "thread"])
+def test_concurrent_direct_tcpip_opens(engine):
+    server_sock, client_sock = socket.socketpair()
+    server = SshServer(lambda host, port: socket.create_connection((host, port)), engine, paramiko.RSAKey.generate(2048))
+    thread = threading.Thread(target=server.start, args=(server_sock,), daemon=True)
+    thread.start()
+
+    transport = paramiko.Transport(client_sock)
+    try:
+        transport.start_client(timeout=30)
+        transport.auth_none("test")
+        result = open_many(transport, start_echo_server(), CHANNELS)
+
+        assert result["failures"] == 0
+        assert result["open_ms"]["n"] == CHANNELS
+        # every channel was closed by the client, nothing should be left open or waiting on either side
+        assert wait_for(lambda: len(transport._channels) == 0 and len(server.transport._channels) == 0)
+        assert server.channels._waiters == {}
+        assert server.channels._unclaimed == {}
+    finally:
+        transport.close()
+        server.event.set()
+        thread.join(10)
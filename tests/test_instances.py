@@ -0,0 +1,149 @@
+import pytest
+import boto3
+from botocore.stub import Stubber
+from confclasses import load_config
+
+from ssm_cli.config import config
+from ssm_cli.instances import Instances, join_instances
+
+# past the old single page limit several times over, the tagging api pages 100 at a time and ssm 50
+FLEET = 12000
+TAGGING_PAGE_SIZE = 100
+SSM_PAGE_SIZE = 50
+
+
+def instance_ids(count: int) -> list:
+    return [f"i-{n:017x}" for n in range(count)]
+
+
+def ip(n: int) -> str:
+    return f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+
+
+def ping(n: int) -> str:
+    return "Online" if n % 10 else "ConnectionLost"
+
+
+def resource(id: str) -> dict:
+    return {
+        "ResourceARN": f"arn:aws:ec2:eu-west-1:123456789012:instance/{id}",
+        "Tags": [
+            {"Key": "Environment", "Value": "test"},
+            {"Key": "group", "Value": "test"},
+            {"Key": "Name", "Value": f"name-{id}"},
+        ],
+    }
+
+
+def information(id: str, n: int) -> dict:
+    return {"InstanceId": id, "IPAddress": ip(n), "PingStatus": ping(n)}
+
+
+def pages(items: list, size: int) -> list:
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+@pytest.fixture(autouse=True)
+def loaded_config():
+    load_config(config, "group_tag_key: group\ncache:\n  enabled: false\n")
+
+
+def test_join_matches_every_pair_across_pages():
+    ids = instance_ids(FLEET)
+    # the two apis page in different orders, and each has instances the other does not
+    resources = [resource(id) for id in ids[:FLEET - 500]]
+    infos = [information(id, n) for n, id in enumerate(ids) if n >= 500][::-1]
+
+    def resource_stream():
+        for page in pages(resources, TAGGING_PAGE_SIZE):
+            yield from page
+
+    def information_stream():
+        for page in pages(infos, SSM_PAGE_SIZE):
+            yield from page
+
+    joined = list(join_instances(resource_stream(), information_stream()))
+
+    assert len(joined) == FLEET - 1000
+    assert len({instance.id for instance in joined}) == len(joined)
+    positions = {id: n for n, id in enumerate(ids)}
+    for instance in joined:
+        n = positions[instance.id]
+        assert 500 <= n < FLEET - 500
+        assert instance.name == f"name-{instance.id}"
+        assert instance.ip == ip(n)
+        assert instance.ping == ping(n)
+
+
+def test_join_with_nothing_on_one_side():
+    resources = [resource(id) for id in instance_ids(10)]
+    assert list(join_instances(iter(resources), iter([]))) == []
+
+
+def stubbed_session(ids: list, online_only: bool) -> boto3.Session:
+    """ A session whose clients replay every page, checking the filters and page tokens asked for """
+    session = boto3.Session(region_name="eu-west-1", aws_access_key_id="test", aws_secret_access_key="test")
+    clients = {
+        "ssm": session.client("ssm"),
+        "resourcegroupstaggingapi": session.client("resourcegroupstaggingapi"),
+    }
+
+    tagging = Stubber(clients["resourcegroupstaggingapi"])
+    resource_pages = pages([resource(id) for id in reversed(ids)], TAGGING_PAGE_SIZE)
+    for number, page in enumerate(resource_pages):
+        params = {"ResourceTypeFilters": ["ec2:instance"], "TagFilters": [{"Key": "group", "Values": ["test"]}]}
+        if number:
+            params["PaginationToken"] = str(number)
+        last = number == len(resource_pages) - 1
+        tagging.add_response(
+            "get_resources",
+            {"ResourceTagMappingList": page, "PaginationToken": "" if last else str(number + 1)},
+            params
+        )
+
+    ssm = Stubber(clients["ssm"])
+    filters = [{"Key": "tag:group", "Values": ["test"]}]
+    if online_only:
+        filters.append({"Key": "PingStatus", "Values": ["Online"]})
+    # with the filter pushed down AWS only sends back Online instances
+    infos = [information(id, n) for n, id in enumerate(ids) if not online_only or ping(n) == "Online"]
+    info_pages = pages(infos, SSM_PAGE_SIZE)
+    for number, page in enumerate(info_pages):
+        params = {"Filters": filters}
+        if number:
+            params["NextToken"] = str(number)
+        response = {"InstanceInformationList": page}
+        if number < len(info_pages) - 1:
+            response["NextToken"] = str(number + 1)
+        ssm.add_response("describe_instance_information", response, params)
+
+    tagging.activate()
+    ssm.activate()
+    session.client = lambda name, **kwargs: clients[name]
+    session.stubbers = (tagging, ssm)
+    return session
+
+
+@pytest.mark.parametrize("online_only", [False, True])
+def test_list_instances_reads_every_page(online_only):
+    ids = instance_ids(FLEET)
+    session = stubbed_session(ids, online_only)
+
+    instances = Instances(session).list_instances("test", online_only)
+
+    expected = [id for n, id in enumerate(ids) if not online_only or ping(n) == "Online"]
+    assert sorted(instance.id for instance in instances) == expected
+    for stubber in session.stubbers:
+        stubber.assert_no_pending_responses()
+
+
+def test_online_only_selector_pushes_down_ping_filter():
+    ids = instance_ids(FLEET)
+    session = stubbed_session(ids, online_only=True)
+
+    instance = Instances(session).select_instance("test", "first")
+
+    # first picks the lowest ip, instance 0 is ConnectionLost so never comes back
+    assert instance.id == ids[1]
+    for stubber in session.stubbers:
+        stubber.assert_no_pending_responses()
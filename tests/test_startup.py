@@ -0,0 +1,19 @@
+import subprocess
+import sys
+
+# every ssh connection through proxycommand imports the cli first, these are only wanted once a command needs them
+HEAVY_MODULES = ["boto3", "paramiko", "blessed", "confclasses"]
+
+PROBE = """
+import json, sys
+import ssm_cli.cli
+print(json.dumps([module for module in sys.argv[1:] if module in sys.modules]))
+"""
+
+
+def test_importing_cli_loads_no_heavy_modules():
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, *HEAVY_MODULES],
+        capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"